@@ -0,0 +1,9 @@
+def cache_from_url(url, name):
+    """
+    CACHES entry for CACHE_URL: redis://host:6379/0, file:///var/tmp/django_cache or locmem://
+    """
+    if url.startswith(('redis://', 'rediss://')):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url, 'KEY_PREFIX': name}
+    if url.startswith('file://'):
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': f"{url[len('file://'):]}/{name}"}
+    return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name}
@@ -101,6 +101,22 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+}
+
+CATALOG_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -123,13 +139,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'user.hashers.ConfigurableArgon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.ScryptPasswordHasher',
 ]
 
+# Measure on the deployment host with `manage.py bench_password_hasher`
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 102400
+ARGON2_PARALLELISM = 8
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -159,12 +180,20 @@ AUTH_USER_MODEL = 'user.MyUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Reads the cookie, then the Authorization header
         'user.customJWTauth.CookieJWTAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
+    # Token buckets (user.throttling): burst size / time to refill it
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_email': '5/min',
+        'register_ip': '10/hour',
+    },
+    # No proxy in dev: throttles key on REMOTE_ADDR, X-Forwarded-For is ignored
+    'NUM_PROXIES': 0,
 }
 
 SIMPLE_JWT = {
@@ -174,8 +203,13 @@ SIMPLE_JWT = {
     'SIGNING_KEY': 'django-insecure-vg$(&eo=ezp^us9q+66@tzs8(^p8m6^d!r3k79ea8=!=^m!y91', #Not the final key
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    # Adds the email and is_staff claims used by CookieJWTAuthentication
+    'TOKEN_OBTAIN_SERIALIZER': 'user.serializers.MyTokenObtainPairSerializer',
 }
 
+# New refresh cookie at each refresh, the used token is denied until it expires (user.tokens)
+JWT_ROTATE_REFRESH_TOKENS = False
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'USER_CREATE_PASSWORD_RETYPE': True,
@@ -187,4 +221,8 @@ DJOSER = {
     },
 }
 
-STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
\ No newline at end of file
+STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
+# Signing secret of the webhook endpoint, only needed to receive Stripe events
+STRIPE_WEBHOOK_SK = config('STRIPE_WEBHOOK_SK', default='')
+# Product images are written under MEDIA_ROOT instead of Cloudinary in dev
+IMAGE_UPLOAD_BACKEND = 'product.uploads.LocalFileSystemBackend'
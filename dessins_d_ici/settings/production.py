@@ -96,6 +96,22 @@ DATABASES = {
         conn_max_age=500),
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# CACHE_URL: redis://host:6379/0, file:///var/tmp/django_cache or locmem://
+
+from .caches import cache_from_url
+
+CACHE_URL = config('CACHE_URL', default='locmem://')
+
+CACHES = {
+    'default': cache_from_url(CACHE_URL, 'default'),
+    'catalog': cache_from_url(CACHE_URL, 'catalog'),
+}
+
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -115,13 +131,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'user.hashers.ConfigurableArgon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.ScryptPasswordHasher',
 ]
 
+# Measure on the deployment host with `manage.py bench_password_hasher`
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', default=2, cast=int)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', default=102400, cast=int)
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', default=8, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -169,12 +190,21 @@ AUTH_USER_MODEL = 'user.MyUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Reads the cookie, then the Authorization header
         'user.customJWTauth.CookieJWTAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
+    # Token buckets (user.throttling): burst size / time to refill it
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_email': '5/min',
+        'register_ip': '10/hour',
+    },
+    # Proxies in front of the app: throttles read the client IP they appended
+    # to X-Forwarded-For, the entries sent by the client are ignored
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
 }
 
 SIMPLE_JWT = {
@@ -184,8 +214,13 @@ SIMPLE_JWT = {
     'SIGNING_KEY': config('SECRET_KEY'),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    # Adds the email and is_staff claims used by CookieJWTAuthentication
+    'TOKEN_OBTAIN_SERIALIZER': 'user.serializers.MyTokenObtainPairSerializer',
 }
 
+# New refresh cookie at each refresh, the used token is denied until it expires (user.tokens)
+JWT_ROTATE_REFRESH_TOKENS = config('JWT_ROTATE_REFRESH_TOKENS', default=False, cast=bool)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'USER_CREATE_PASSWORD_RETYPE': True,
@@ -196,3 +231,6 @@ DJOSER = {
         'user_delete': 'djoser.serializers.UserDeleteSerializer',      
     },
 }
+
+STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
+STRIPE_WEBHOOK_SK = config('STRIPE_WEBHOOK_SK')
@@ -1,14 +1,37 @@
 from django.contrib import admin
 
-from .models import Category, Product, Order, OrderItem
+from .models import Category, Product, Order, OrderItem, ImageJob, WebhookEvent
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
 
 class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
+    list_display = ('order_id', 'user', 'status', 'item_count', 'total_price', 'created_at')
+    readonly_fields = ('item_count', 'total_price')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals()
+
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'category', 'price', 'processing_status')
+    list_filter = ('processing_status',)
+    readonly_fields = ('processing_status',)
+
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('product', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('last_error',)
+
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'type')
+    readonly_fields = ('payload', 'last_error')
 
 
 admin.site.register(Order, OrderAdmin)
 admin.site.register(Category)
-admin.site.register(Product)
+admin.site.register(Product, ProductAdmin)
+admin.site.register(ImageJob, ImageJobAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
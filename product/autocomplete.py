@@ -0,0 +1,228 @@
+from bisect import bisect_left, insort
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum
+
+from .search import TOKEN_RE, unaccent
+
+MAX_SUGGESTIONS = 10
+# Seconds between two checks of the catalog version (writes made by other processes)
+REFRESH_INTERVAL = getattr(settings, 'AUTOCOMPLETE_REFRESH_INTERVAL', 10)
+
+CATEGORY = 0
+PRODUCT = 1
+
+
+def normalize(text):
+    return ' '.join(TOKEN_RE.findall(unaccent((text or '').lower())))
+
+
+def prefix_keys(name):
+    """
+    'Chat noir' is found by 'chat', 'chat n' and 'noir': one key
+    per word, from that word to the end of the name
+    """
+    words = normalize(name).split()
+    return sorted({' '.join(words[index:]) for index in range(len(words))})
+
+
+def catalog_version():
+    """
+    (sum of the category versions, number of categories): every product
+    write bumps its category, in whatever process it happens
+    (see conditional.latest_products_state)
+    """
+    from .models import Category
+
+    state = Category.objects.aggregate(version=Sum('version'), count=Count('id'))
+    return state['version'] or 0, state['count']
+
+
+def thumbnail_url(product):
+    """
+    Right after processing the field still holds the uploaded value, not a resource
+    """
+    if not product.thumbnail:
+        return None
+    return product._meta.get_field('thumbnail').to_python(product.thumbnail).url
+
+
+class PrefixIndex:
+    """
+    One sorted array of (key, id) tuples per kind: a prefix lookup is a
+    bisect followed by a forward scan that stops after `limit` matches.
+    Names and thumbnails are stored once per product or category in `records`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.entries = None
+            self.records = {}
+            self.version = None
+            self.checked_at = 0
+            # Updates made while a rebuild runs, replayed on the new index
+            self.pending = None
+
+    def load(self):
+        """
+        New (entries, records, version), read without holding the lock.
+        The version is read first: a write committed during the load
+        makes the next check rebuild again.
+        """
+        from .models import Category, Product
+
+        version = catalog_version()
+        entries, records = {CATEGORY: [], PRODUCT: []}, {}
+        for category in Category.objects.only('pk', 'name').iterator():
+            records[CATEGORY, category.pk] = (category.name, None)
+            entries[CATEGORY].extend((key, category.pk) for key in prefix_keys(category.name))
+        for product in Product.objects.only('pk', 'name', 'thumbnail').iterator(chunk_size=2000):
+            records[PRODUCT, product.pk] = (product.name, thumbnail_url(product))
+            entries[PRODUCT].extend((key, product.pk) for key in prefix_keys(product.name))
+        for keys in entries.values():
+            keys.sort()
+        return entries, records, version
+
+    def swap(self, entries, records, version):
+        with self.lock:
+            pending, self.pending = self.pending or [], None
+            self.entries, self.records, self.version = entries, records, version
+            self.checked_at = time.monotonic()
+            for update in pending:
+                update()
+
+    def build(self):
+        self.swap(*self.load())
+
+    def rebuild(self):
+        try:
+            self.build()
+        finally:
+            with self.lock:
+                self.pending = None
+
+    def start_rebuild(self):
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                connections.close_all()
+        threading.Thread(target=run, daemon=True).start()
+
+    def refresh(self):
+        """
+        Build on first use. When another process changed the catalog, rebuild
+        in a thread and keep answering from the current index meanwhile.
+        """
+        with self.lock:
+            if self.entries is not None:
+                if self.pending is not None or time.monotonic() - self.checked_at <= REFRESH_INTERVAL:
+                    return
+                self.checked_at = time.monotonic()
+        if self.entries is None:
+            with self.build_lock:
+                if self.entries is None:
+                    self.build()
+        elif catalog_version() != self.version:
+            with self.lock:
+                if self.pending is not None:
+                    return
+                self.pending = []
+            self.start_rebuild()
+
+    def applied(self, bumps):
+        """
+        A write of this process, already in the index, committed `bumps`
+        category versions: expect them instead of rebuilding. A write made
+        elsewhere in between still makes the versions differ.
+        """
+        with self.lock:
+            if self.version is not None:
+                self.version = (self.version[0] + bumps, self.version[1])
+
+    def _remove(self, kind, pk):
+        record = self.records.pop((kind, pk), None)
+        if record is None:
+            return
+        entries = self.entries[kind]
+        for key in prefix_keys(record[0]):
+            index = bisect_left(entries, (key, pk))
+            if index < len(entries) and entries[index] == (key, pk):
+                del entries[index]
+
+    def _add(self, kind, pk, name, thumbnail=None):
+        self.records[kind, pk] = (name, thumbnail)
+        for key in prefix_keys(name):
+            insort(self.entries[kind], (key, pk))
+
+    def _replace(self, kind, pk, name, thumbnail=None):
+        self._remove(kind, pk)
+        self._add(kind, pk, name, thumbnail)
+
+    def apply(self, update, *args):
+        """
+        Run `update` on the index, and again on the one being rebuilt
+        """
+        with self.lock:
+            if self.entries is None:
+                return
+            update(*args)
+            if self.pending is not None:
+                self.pending.append(lambda: update(*args))
+
+    def update_product(self, product):
+        self.apply(self._replace, PRODUCT, product.pk, product.name, thumbnail_url(product))
+
+    def update_category(self, category):
+        self.apply(self._replace, CATEGORY, category.pk, category.name)
+
+    def remove_product(self, pk):
+        self.apply(self._remove, PRODUCT, pk)
+
+    def remove_category(self, pk):
+        self.apply(self._remove, CATEGORY, pk)
+
+    def _scan(self, kind, prefix, limit):
+        entries, found, seen = self.entries[kind], [], set()
+        index = bisect_left(entries, (prefix,))
+        while index < len(entries) and len(found) < limit:
+            key, pk = entries[index]
+            if not key.startswith(prefix):
+                break
+            if pk not in seen:
+                seen.add(pk)
+                found.append((pk, *self.records[kind, pk]))
+            index += 1
+        return found
+
+    def suggest(self, text, limit=MAX_SUGGESTIONS):
+        prefix = normalize(text)
+        if not prefix:
+            return {'categories': [], 'products': []}
+
+        self.refresh()
+        with self.lock:
+            found = {kind: self._scan(kind, prefix, limit) for kind in (CATEGORY, PRODUCT)}
+
+        return {
+            'categories': [{'id': pk, 'name': name} for pk, name, _ in found[CATEGORY]],
+            'products': [
+                {'id': pk, 'name': name, 'thumbnail': thumbnail}
+                for pk, name, thumbnail in found[PRODUCT]
+            ],
+        }
+
+
+_index = PrefixIndex()
+
+
+def get_index():
+    return _index
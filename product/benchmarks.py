@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.test import modify_settings, override_settings
+
+
+class Rollback(Exception):
+    pass
+
+
+def private_caches(name):
+    """
+    One local memory cache per alias, so a benchmark can clear and fill
+    them without touching the caches of the running site
+    """
+    return {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'bench-{name}-{alias}'}
+        for alias in settings.CACHES
+    }
+
+
+@contextmanager
+def rolled_back(name):
+    """
+    Run the body of a bench command in a transaction that is rolled back,
+    against private caches and without the silk middleware
+    """
+    try:
+        with override_settings(CACHES=private_caches(name)), \
+                modify_settings(MIDDLEWARE={'remove': ['silk.middleware.SilkyMiddleware']}), \
+                transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
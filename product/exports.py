@@ -0,0 +1,134 @@
+import csv
+from itertools import groupby
+import json
+from operator import itemgetter
+import zlib
+
+from .models import Order
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+CSV_COLUMNS = (
+    'order_id', 'created_at', 'status', 'email', 'payment_token',
+    'shipping_name', 'shipping_phone', 'shipping_line1', 'shipping_postal_code', 'shipping_city', 'shipping_country',
+    'item_count', 'total_price', 'product_name', 'unit_price', 'quantity', 'subtotal',
+)
+
+
+ORDER_FIELDS = (
+    'order_id', 'created_at', 'status', 'user__email', 'payment_token',
+    'shipping_details', 'item_count', 'total_price',
+)
+ITEM_FIELDS = ('items__product_name', 'items__unit_price', 'items__quantity')
+
+
+def export_rows(orders=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    One tuple per order item (LEFT JOIN: orders without items give one row
+    of NULL item columns), oldest first. Plain tuples from a server-side
+    cursor: one chunk in memory at a time and no model instances.
+    """
+    orders = Order.objects.all() if orders is None else orders
+    return (
+        orders.prefetch_related(None)
+        .order_by('created_at', 'pk', 'items__id')
+        .values_list(*ORDER_FIELDS, *ITEM_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def group_by_order(rows):
+    """
+    (order columns, [item columns]) for each order, the rows being sorted by order
+    """
+    size = len(ORDER_FIELDS)
+    for _, order_rows in groupby(rows, key=itemgetter(0)):
+        order_rows = list(order_rows)
+        yield order_rows[0][:size], [row[size:] for row in order_rows if row[size] is not None]
+
+
+class Echo:
+    """File-like object for csv.writer: returns each line instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    One line per order item, orders without items get a single line
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order_id, created_at, status, email, payment_token, shipping, item_count, total_price, name, price, quantity in rows:
+        shipping = shipping or {}
+        address = shipping.get('address') or {}
+        subtotal = price * quantity if name is not None else ''
+        yield writer.writerow([
+            order_id, created_at.isoformat(), status, email, payment_token or '',
+            shipping.get('name', ''), shipping.get('phone', ''), address.get('line1', ''),
+            address.get('postal_code', ''), address.get('city', ''), address.get('country', ''),
+            item_count, total_price,
+            name or '', '' if price is None else price, '' if quantity is None else quantity, subtotal,
+        ])
+
+
+def jsonl_lines(rows):
+    """
+    One JSON object per order, items nested
+    """
+    for order, items in group_by_order(rows):
+        order_id, created_at, status, email, payment_token, shipping, item_count, total_price = order
+        yield json.dumps({
+            'order_id': str(order_id),
+            'created_at': created_at.isoformat(),
+            'status': status,
+            'email': email,
+            'payment_token': payment_token,
+            'shipping_details': shipping,
+            'item_count': item_count,
+            'total_price': str(total_price),
+            'items': [
+                {
+                    'product_name': name,
+                    'unit_price': str(price),
+                    'quantity': quantity,
+                    'subtotal': str(price * quantity),
+                }
+                for name, price, quantity in items
+            ],
+        }, ensure_ascii=False) + '\n'
+
+
+def encode(lines, batch_size=64 * 1024):
+    """
+    Encode the lines and group them in blocks of about `batch_size` bytes
+    """
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= batch_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 16 + 15: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_orders(orders=None, file_format='csv', gzip=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream of bytes: the whole export is never held in memory
+    """
+    lines = csv_lines if file_format == 'csv' else jsonl_lines
+    chunks = encode(lines(export_rows(orders, chunk_size)))
+    return gzip_stream(chunks) if gzip else chunks
@@ -1,9 +1,29 @@
-from django_filters import FilterSet
+from django_filters import FilterSet, IsoDateTimeFilter
+from rest_framework.filters import BaseFilterBackend
+
 from .models import Order
+from .search import get_search_backend
 
 class OrderFilter(FilterSet):
+    """?status=, ?created_after= and ?created_before= (ISO dates or datetimes)"""
+    created_after = IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
     class Meta:
         model = Order
         fields = {
             'status': ['exact'],
-        }
\ No newline at end of file
+        }
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Full text search on name and description, annotates a `rank`.
+    Postgres tsvector + GIN in production, in-process inverted index on SQLite.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return get_search_backend().search(queryset, text)
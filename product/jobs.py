@@ -0,0 +1,109 @@
+from datetime import timedelta
+import traceback
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ImageJob, Product
+
+MAX_ATTEMPTS = getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', 5)
+RETRY_BACKOFF = getattr(settings, 'IMAGE_JOB_RETRY_BACKOFF', 30)  # seconds
+MAX_BACKOFF = getattr(settings, 'IMAGE_JOB_MAX_BACKOFF', 3600)
+STALE_AFTER = getattr(settings, 'IMAGE_JOB_STALE_AFTER', 600)
+
+
+def backoff_delay(attempts):
+    """
+    Exponential backoff: 30s, 60s, 120s... capped at MAX_BACKOFF
+    """
+    return timedelta(seconds=min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF))
+
+
+def requeue_stale(model, now=None):
+    """
+    Put back in the queue the rows of a worker that died while running them.
+    `model` is a queue table: ImageJob or WebhookEvent.
+    """
+    now = now or timezone.now()
+    return model.objects.filter(
+        status=model.StatusChoices.RUNNING,
+        locked_at__lt=now - timedelta(seconds=STALE_AFTER)
+    ).update(status=model.StatusChoices.QUEUED, locked_at=None)
+
+
+def claim_next(model, now=None):
+    """
+    Take the oldest runnable row and return its pk. The conditional
+    UPDATE makes sure two workers can never claim the same row.
+    """
+    now = now or timezone.now()
+    candidates = model.objects.filter(
+        status=model.StatusChoices.QUEUED,
+        run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        claimed = model.objects.filter(pk=pk, status=model.StatusChoices.QUEUED).update(
+            status=model.StatusChoices.RUNNING,
+            locked_at=now,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return pk
+    return None
+
+
+def requeue_stale_jobs(now=None):
+    return requeue_stale(ImageJob, now)
+
+
+def claim_next_job(now=None):
+    pk = claim_next(ImageJob, now)
+    if pk is None:
+        return None
+    return ImageJob.objects.select_related('product').get(pk=pk)
+
+
+def run_job(job):
+    """
+    Process the product images, retrying later on failure.
+    Return the pipeline (with its per stage report) or None if it failed.
+    """
+    product = job.product
+    Product.objects.filter(pk=product.pk).update(processing_status=Product.ProcessingStatus.PROCESSING)
+
+    try:
+        pipeline = product.process_images()
+    except Exception:
+        job.last_error = traceback.format_exc()
+        job.locked_at = None
+        if job.attempts < MAX_ATTEMPTS:
+            job.status = ImageJob.StatusChoices.QUEUED
+            job.run_after = timezone.now() + backoff_delay(job.attempts)
+            product_status = Product.ProcessingStatus.PENDING
+        else:
+            job.status = ImageJob.StatusChoices.FAILED
+            product_status = Product.ProcessingStatus.FAILED
+        job.save(update_fields=['status', 'run_after', 'locked_at', 'last_error'])
+        Product.objects.filter(pk=product.pk).update(processing_status=product_status)
+        return None
+
+    job.status = ImageJob.StatusChoices.DONE
+    job.locked_at = None
+    job.save(update_fields=['status', 'locked_at'])
+    return pipeline
+
+
+def run_pending_jobs(limit=None):
+    """
+    Run every runnable job (or at most `limit`), return the number processed
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.autocomplete import get_index
+from product.benchmarks import rolled_back
+from product.management.commands.bench_search import WORDS
+from product.models import Category, Product
+
+PREFIXES = ['c', 'ch', 'chat', 'ele', 'mon', 'pap', 'renard h', 'x']
+
+
+class Command(BaseCommand):
+    help = "Time the autocomplete prefix index on a synthetic catalog (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with rolled_back('autocomplete'):
+            self.run(options)
+        get_index().reset()
+
+    def run(self, options):
+        rng = random.Random(42)
+        category = Category.objects.create(name='Bench', slug='bench')
+        Product.objects.bulk_create(
+            [Product(category=category, name=' '.join(rng.sample(WORDS, 3)), slug=f'dessin-{index}', price=10)
+             for index in range(options['products'])],
+            batch_size=5000,
+        )
+        index = get_index()
+        index.reset()
+
+        start = time.perf_counter()
+        index.suggest('a')
+        entries = sum(len(keys) for keys in index.entries.values())
+        self.stdout.write(f"build: {(time.perf_counter() - start) * 1000:.0f} ms, {entries} keys")
+
+        for prefix in PREFIXES:
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                index.suggest(prefix)
+            elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+            self.stdout.write(f"{prefix!r:>10}: {elapsed * 1000:6.1f} µs")
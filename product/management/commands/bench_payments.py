@@ -0,0 +1,56 @@
+import time
+
+import stripe
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from product.benchmarks import rolled_back
+from product.models import Category, Order, OrderItem, Product
+from product.payments import get_http_client, payment_client_secret
+from product.stripe_stub import StubStripeServer
+from user.models import MyUser
+
+SHIPPING = {'name': 'Jean Dupont', 'address': {'line1': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris', 'country': 'FR'}}
+
+
+class Command(BaseCommand):
+    help = "Checkout reloads against a local Stripe stub: new intent each time vs reused intent (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.08, help="Seconds added by the stub to each Stripe call")
+        parser.add_argument('--reloads', type=int, default=10)
+
+    def handle(self, *args, **options):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        get_http_client()
+        with rolled_back('payments'):
+            self.run(options)
+
+    def run(self, options):
+        user = MyUser.objects.create_user('Bench', 'Mark', 'bench-payments@example.com', 'Password123!')
+        category = Category.objects.create(name='Bench', slug='bench-payments')
+        product = Product.objects.create(category=category, name='Dessin', slug='dessin', price=25)
+        order = Order.objects.create(user=user)
+        OrderItem.objects.create(order=order, product=product, quantity=2)
+        order.update_totals()
+
+        def legacy():
+            stripe.PaymentIntent.create(amount=int(order.total_price * 100), currency='eur', shipping=SHIPPING)
+
+        def reuse():
+            payment_client_secret(order, SHIPPING)
+            order.shipping_details = SHIPPING
+
+        for name, checkout in (('new intent', legacy), ('reused', reuse)):
+            cache.clear()
+            with StubStripeServer(latency=options['latency']) as server:
+                start = time.perf_counter()
+                for _ in range(options['reloads']):
+                    checkout()
+                elapsed = (time.perf_counter() - start) / options['reloads'] * 1000
+            self.stdout.write(
+                f"{name:>10}: {elapsed:7.1f} ms/reload, {len(server.calls)} Stripe calls, "
+                f"{len(server.intents)} intents, {server.connections} connections"
+            )
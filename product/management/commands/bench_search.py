@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from product.benchmarks import rolled_back
+from product.models import Category, Product
+from product.search import get_search_backend
+
+WORDS = [
+    'chat', 'chien', 'cheval', 'oiseau', 'éléphant', 'fleur', 'arbre', 'montagne', 'mer', 'forêt',
+    'rivière', 'maison', 'portrait', 'paysage', 'crayon', 'aquarelle', 'encre', 'fusain', 'nuit',
+    'soleil', 'lune', 'étoile', 'jardin', 'village', 'bateau', 'renard', 'hibou', 'papillon',
+]
+QUERIES = ['chat', 'chevaux aquarelle', 'renard', 'étoiles nuit', 'montagne', 'papillons jardin']
+
+
+class Command(BaseCommand):
+    help = "Compare the old icontains search with the full text backend on a synthetic catalog (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back('search'):
+            self.run(options)
+        get_search_backend().reset()
+
+    def run(self, options):
+        rng = random.Random(42)
+        category = Category.objects.create(name='Bench', slug='bench')
+        Product.objects.bulk_create(
+            [
+                Product(
+                    category=category,
+                    name=' '.join(rng.sample(WORDS, 2)),
+                    slug=f'dessin-{index}',
+                    price=10,
+                    description=' '.join(rng.choices(WORDS, k=12)),
+                )
+                for index in range(options['products'])
+            ],
+            batch_size=5000,
+        )
+        products = Product.objects.order_by('-date_added', '-id')
+        backend = get_search_backend()
+        backend.reset()
+
+        start = time.perf_counter()
+        list(backend.search(products, 'chat')[:20])
+        self.stdout.write(f"{backend.__class__.__name__}: first search (index build) {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        def icontains(text):
+            query = Q()
+            for term in text.split():
+                query &= Q(name__icontains=term) | Q(description__icontains=term)
+            return list(products.filter(query)[:20])
+
+        def full_text(text):
+            return list(backend.search(products, text).order_by('-rank', '-id')[:20])
+
+        for name, search in (('icontains', icontains), ('full text', full_text)):
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                for text in QUERIES:
+                    search(text)
+            elapsed = (time.perf_counter() - start) / (options['repeat'] * len(QUERIES)) * 1000
+            self.stdout.write(f"{name:>10}: {elapsed:7.2f} ms/query")
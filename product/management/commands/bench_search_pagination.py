@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework import filters
+from rest_framework.pagination import LimitOffsetPagination
+
+from product.benchmarks import rolled_back
+from product.models import Category, Product
+from product.pagination import KeysetPagination
+from product.views import SearchProduct
+
+
+class OffsetSearch(SearchProduct):
+    """SearchProduct as it was: LIMIT/OFFSET with COUNT(*)"""
+    filter_backends = SearchProduct.filter_backends + [filters.OrderingFilter]
+    pagination_class = LimitOffsetPagination
+
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class KeysetSearch(SearchProduct):
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = "Compare page 1 and page N of SearchProduct with offset and keyset pagination (synthetic data, rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--page', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back('search-pagination'):
+            self.run(options)
+
+    def run(self, options):
+        size, page = options['page_size'], options['page']
+        category = Category.objects.create(name='Bench', slug='bench')
+        Product.objects.bulk_create(
+            [Product(category=category, name=f'Dessin {index}', slug=f'dessin-{index}', price=index % 500 + 1)
+             for index in range(options['products'])],
+            batch_size=2000,
+        )
+
+        # Start of the requested page, to build its cursor without walking every page
+        offset = (page - 1) * size
+        previous_row = Product.objects.order_by('-date_added', '-id')[offset - 1] if offset else None
+        cursor = KeysetPagination().encode_cursor('-date_added', previous_row, reverse=False) if previous_row else None
+
+        factory = RequestFactory()
+        cases = [
+            ('offset', OffsetSearch, '', f'?limit={size}&offset={offset}'),
+            ('keyset', KeysetSearch, f'?limit={size}', f'?limit={size}&cursor={cursor}'),
+        ]
+        for name, view_class, first, deep in cases:
+            view = view_class.as_view()
+            for label, query in (('page 1', first), (f'page {page}', deep)):
+                request = factory.get(f'/api/v1/products/{query}', HTTP_HOST='localhost')
+                with CaptureQueriesContext(connection) as queries:
+                    view(request).render()
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    view(request).render()
+                elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+                self.stdout.write(f"{name:>7} {label:>9}: {elapsed:7.2f} ms, {len(queries)} queries")
@@ -0,0 +1,54 @@
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from django.core.management.base import BaseCommand
+
+from product import watermark
+
+
+def legacy_watermark(img):
+    """
+    The previous Product.add_watermark: font, tile and layer rebuilt on every call
+    """
+    img = img.convert('RGBA')
+    font = ImageFont.truetype(watermark.FONT_PATH, watermark.WATERMARK_SIZE)
+    width, height = img.size
+
+    text_bbox = font.getbbox(watermark.WATERMARK_TEXT)
+    tile_size = (text_bbox[2] + 20, text_bbox[3] + 20)
+    tile = Image.new('RGBA', tile_size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    draw.text((10, 10), watermark.WATERMARK_TEXT, font=font, fill=watermark.WATERMARK_COLOR)
+    tile = tile.rotate(watermark.WATERMARK_ANGLE, expand=True)
+
+    layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    for x in range(0, width, tile.width + watermark.TILE_SPACING):
+        for y in range(0, height, tile.height + watermark.TILE_SPACING):
+            layer.paste(tile, (x, y), tile)
+
+    return Image.alpha_composite(img, layer).convert('RGB')
+
+
+class Command(BaseCommand):
+    help = "Compare the legacy watermark path with the cached watermark engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--width', type=int, default=600)
+        parser.add_argument('--height', type=int, default=800)
+
+    def handle(self, *args, **options):
+        img = Image.new('RGB', (options['width'], options['height']), (200, 120, 40))
+        iterations = options['iterations']
+        watermark.clear_caches()
+
+        results = {}
+        for name, func in (('legacy', legacy_watermark), ('cached', watermark.apply_watermark)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func(img)
+            results[name] = (time.perf_counter() - start) / iterations * 1000
+            self.stdout.write(f"{name:>7}: {results[name]:.2f} ms/image")
+
+        self.stdout.write(self.style.SUCCESS(f"speedup: x{results['legacy'] / results['cached']:.1f}"))
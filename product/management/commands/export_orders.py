@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.exports import FORMATS, export_orders
+from product.filters import OrderFilter
+from product.models import Order
+
+
+class Command(BaseCommand):
+    help = "Stream the orders and their items as CSV or JSONL, for accounting"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-format', choices=FORMATS, default='csv')
+        parser.add_argument('--created-after', help="ISO date or datetime, included")
+        parser.add_argument('--created-before', help="ISO date or datetime, excluded")
+        parser.add_argument('--status', choices=Order.StatusChoices.values)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', help="File to write (default: standard output)")
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in ('created_after', 'created_before', 'status') if options[name]}
+        filterset = OrderFilter(params, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        chunks = export_orders(filterset.qs, options['output_format'], options['gzip'])
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
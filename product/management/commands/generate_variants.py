@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+
+import requests
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product import cache
+from product.models import Category, Product, ProductImageVariant
+from product.pipeline import process_variants
+from product.signals import product_scopes
+from product.uploads import upload_many
+
+
+class Command(BaseCommand):
+    help = "Generate the responsive image variants of existing products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate products that already have variants")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Image processes (default: one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        products = Product.objects.select_related('category').exclude(image__isnull=True).exclude(image='').order_by('pk')
+        if not options['all']:
+            products = products.filter(variants__isnull=True)
+
+        self.session = requests.Session()
+        workers = options['workers'] or 1
+        generated = failed = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as processes, ThreadPoolExecutor(max_workers=8) as threads:
+            for product in products.iterator(chunk_size=options['batch_size']):
+                batch.append(product)
+                if len(batch) >= options['batch_size']:
+                    done, errors = self.generate_batch(batch, processes, threads)
+                    generated, failed = generated + done, failed + errors
+                    batch = []
+            if batch:
+                done, errors = self.generate_batch(batch, processes, threads)
+                generated, failed = generated + done, failed + errors
+
+        self.stdout.write(self.style.SUCCESS(f"Variantes générées pour {generated} produits, {failed} échecs"))
+
+    def fetch_source(self, product):
+        """
+        Prefer the local original (watermarked by the pipeline),
+        else download the already watermarked image
+        """
+        if product.original:
+            with product.original.open('rb') as original:
+                return original.read(), True
+        response = self.session.get(product.image.url, timeout=10)
+        response.raise_for_status()
+        return response.content, False
+
+    def generate_batch(self, batch, processes, threads):
+        sources = []
+        for product, future in [(product, threads.submit(self.fetch_source, product)) for product in batch]:
+            try:
+                sources.append((product, future.result()))
+            except Exception as e:
+                self.stderr.write(f"{product} ignoré: {e}")
+
+        if not sources:
+            return 0, len(batch)
+
+        outputs = list(processes.map(
+            process_variants,
+            [data for _, (data, _) in sources],
+            [watermark for _, (_, watermark) in sources],
+        ))
+        urls = upload_many(outputs)
+
+        products = [product for product, _ in sources]
+        with transaction.atomic():
+            ProductImageVariant.objects.filter(product__in=products).delete()
+            ProductImageVariant.objects.bulk_create([
+                variant
+                for product, product_outputs, product_urls in zip(products, outputs, urls)
+                for variant in ProductImageVariant.from_outputs(product, product_outputs, product_urls)
+            ])
+
+        Category.touch(*{product.category_id for product in products})
+        cache.invalidate('latest', 'search', *[
+            scope
+            for product in products
+            for scope in product_scopes(product.category.slug, product.slug)
+        ])
+
+        self.stdout.write(f"{len(products)} produits traités")
+        return len(products), len(batch) - len(products)
@@ -0,0 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from product import cache
+from product.models import Category, Product, ProductImageVariant
+from product.pipeline import process_file
+from product.search import get_search_backend
+from product.uploads import upload_many
+
+
+def read_manifest(path):
+    """
+    Yield the rows of a CSV or JSONL manifest as dicts
+    """
+    with open(path, newline='', encoding='utf-8') as manifest:
+        if path.suffix == '.csv':
+            yield from csv.DictReader(manifest)
+        elif path.suffix in ('.jsonl', '.ndjson'):
+            for line in manifest:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise CommandError("Le manifeste doit être un fichier .csv ou .jsonl")
+
+
+def row_key(row):
+    return f"{row['category']}/{row['slug']}"
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV/JSONL manifest and a directory of source images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', type=Path, help="CSV or JSONL file: name, slug, category, price, description, image")
+        parser.add_argument('--images', type=Path, required=True, help="Directory containing the source images")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Image processes (default: one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--checkpoint', type=Path, help="Progress file, defaults to <manifest>.checkpoint")
+
+    def handle(self, *args, **options):
+        manifest = options['manifest']
+        if not manifest.exists():
+            raise CommandError(f"Manifeste introuvable: {manifest}")
+
+        checkpoint = options['checkpoint'] or manifest.with_name(manifest.name + '.checkpoint')
+        done = self.read_checkpoint(checkpoint)
+        categories = dict(Category.objects.values_list('slug', 'id'))
+        # Also covers a crash between a batch commit and its checkpoint write
+        existing = {f'{category}/{slug}' for category, slug in Product.objects.values_list('category__slug', 'slug')}
+        seen = set()
+        self.workers = options['workers'] or 1
+        images = Path(options['images'])
+
+        imported = skipped = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor, open(checkpoint, 'a') as progress:
+            for row in read_manifest(manifest):
+                row.setdefault('slug', slugify(row.get('name', '')))
+                if row_key(row) in done:
+                    continue
+
+                error = self.validate(row, categories, images, existing, seen)
+                seen.add(row_key(row))
+                if error:
+                    self.stderr.write(f"{row_key(row)} ignoré: {error}")
+                    skipped += 1
+                    continue
+
+                batch.append(row)
+                if len(batch) >= options['batch_size']:
+                    imported += self.import_batch(batch, categories, images, executor, progress)
+                    batch = []
+
+            if batch:
+                imported += self.import_batch(batch, categories, images, executor, progress)
+
+        self.stdout.write(self.style.SUCCESS(f"{imported} produits importés, {skipped} ignorés"))
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint.exists():
+            return set()
+        return set(checkpoint.read_text(encoding='utf-8').split())
+
+    def validate(self, row, categories, images, existing=(), seen=()):
+        if row_key(row) in seen:
+            return "en double dans le manifeste"
+        if row_key(row) in existing:
+            return "existe déjà en base"
+        if row.get('category') not in categories:
+            return f"catégorie inconnue '{row.get('category')}'"
+        if not row.get('name'):
+            return "nom manquant"
+        try:
+            row['price'] = Decimal(str(row.get('price')))
+        except InvalidOperation:
+            return f"prix invalide '{row.get('price')}'"
+        if not row.get('image'):
+            return "image manquante"
+        if not (images / row['image']).is_file():
+            return f"image introuvable '{row.get('image')}'"
+        return None
+
+    def import_batch(self, batch, categories, images, executor, progress):
+        """
+        Process the images across the pool, upload them, insert the rows,
+        then record the batch in the checkpoint
+        """
+        chunksize = max(1, len(batch) // (self.workers * 4))
+        outputs = list(executor.map(process_file, [images / row['image'] for row in batch], chunksize=chunksize))
+        urls = upload_many(outputs)
+
+        products = [
+            Product(
+                category_id=categories[row['category']],
+                name=row['name'],
+                slug=row['slug'],
+                description=row.get('description') or None,
+                price=row['price'],
+                image=url['image'],
+                thumbnail=url['thumbnail'],
+                processing_status=Product.ProcessingStatus.DONE,
+            )
+            for row, url in zip(batch, urls)
+        ]
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            ProductImageVariant.objects.bulk_create([
+                variant
+                for product, product_outputs, product_urls in zip(products, outputs, urls)
+                for variant in ProductImageVariant.from_outputs(product, product_outputs, product_urls)
+            ])
+
+        get_search_backend().update(*products)
+        Category.touch(*{categories[row['category']] for row in batch})
+        cache.invalidate('latest', 'search', *{f"category:{row['category']}" for row in batch})
+
+        progress.write(''.join(f"{row_key(row)}\n" for row in batch))
+        progress.flush()
+        os.fsync(progress.fileno())
+
+        self.stdout.write(f"{len(batch)} produits importés")
+        return len(batch)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Worker that resizes, watermarks and uploads the queued product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the queue then exit")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Image worker started")
+        try:
+            while True:
+                requeue_stale_jobs()
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                pipeline = run_job(job)
+                if pipeline:
+                    self.stdout.write(self.style.SUCCESS(f"{job} done: {pipeline.summary()}"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"{job} failed (attempt {job.attempts}): {job.status}"))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Image worker stopped")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.jobs import requeue_stale
+from product.models import WebhookEvent
+from product.webhooks import claim_next_event, run_event
+
+
+class Command(BaseCommand):
+    help = "Worker that applies the stored Stripe events to the orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the queue then exit")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Webhook worker started")
+        try:
+            while True:
+                requeue_stale(WebhookEvent)
+                event = claim_next_event()
+                if event is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                if run_event(event):
+                    self.stdout.write(self.style.SUCCESS(f"{event} done"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"{event} failed (attempt {event.attempts}): {event.status}"))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Webhook worker stopped")
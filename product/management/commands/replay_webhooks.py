@@ -0,0 +1,58 @@
+from datetime import datetime, time
+import json
+
+import stripe
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from product.models import WebhookEvent
+from product.webhooks import HANDLERS, run_pending_events, store_event
+
+
+class Command(BaseCommand):
+    help = "Catch up after an outage: fetch the missed Stripe events, retry the failed ones, then apply them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Fetch the Stripe events created since this ISO datetime or date")
+        parser.add_argument('--failed', action='store_true', help="Queue the failed events again")
+        parser.add_argument('--no-run', action='store_true', help="Only queue the events, let the worker apply them")
+
+    def parse_since(self, value):
+        """
+        An ISO datetime or a plain date (from midnight), in TIME_ZONE when no offset is given
+        """
+        try:
+            since = parse_datetime(value)
+            if since is None and parse_date(value) is not None:
+                since = datetime.combine(parse_date(value), time.min)
+        except ValueError:
+            since = None
+        if since is None:
+            raise CommandError(f"Date invalide: {value}")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def handle(self, *args, **options):
+        if options['since']:
+            since = self.parse_since(options['since'])
+            stripe.api_key = settings.STRIPE_SECRET_KEY
+            events = stripe.Event.list(created={'gte': int(since.timestamp())}, types=list(HANDLERS), limit=100)
+            fetched = 0
+            for event in events.auto_paging_iter():
+                store_event(event['id'], event['type'], json.loads(str(event)))
+                fetched += 1
+            self.stdout.write(f"{fetched} événements récupérés depuis Stripe (déjà reçus: ignorés)")
+
+        if options['failed']:
+            requeued = WebhookEvent.objects.filter(status=WebhookEvent.StatusChoices.FAILED).update(
+                status=WebhookEvent.StatusChoices.QUEUED, attempts=0, locked_at=None, run_after=timezone.now()
+            )
+            self.stdout.write(f"{requeued} événements en échec remis en file")
+
+        if not options['no_run']:
+            processed = run_pending_events()
+            self.stdout.write(self.style.SUCCESS(f"{processed} événements traités"))
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:26
+
+import django.core.files.storage
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_alter_order_payment_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='original',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=django.core.files.storage.FileSystemStorage(), upload_to='originals/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='processing_status',
+            field=models.CharField(choices=[('En attente', 'Pending'), ('En cours', 'Processing'), ('Terminé', 'Done'), ('Échec', 'Failed')], default='Terminé', editable=False, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('En attente', 'Queued'), ('En cours', 'Running'), ('Terminé', 'Done'), ('Échec', 'Failed')], default='En attente', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='product.product')),
+            ],
+            options={
+                'ordering': ('run_after',),
+                'indexes': [models.Index(fields=['status', 'run_after'], name='product_ima_status_1f9aeb_idx')],
+            },
+        ),
+    ]
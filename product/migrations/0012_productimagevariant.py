@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_product_processing_status_imagejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('size', models.PositiveIntegerField(help_text='Size in bytes')),
+                ('url', models.URLField(max_length=500)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='product.product')),
+            ],
+            options={
+                'ordering': ('format', 'width'),
+                'constraints': [models.UniqueConstraint(fields=('product', 'width', 'format'), name='unique_product_variant')],
+            },
+        ),
+    ]
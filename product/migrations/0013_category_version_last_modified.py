@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0012_productimagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
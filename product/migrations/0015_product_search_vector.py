@@ -0,0 +1,69 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:39
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# PostgreSQL only: french stemming without accents, a trigger keeping
+# search_vector up to date on every insert/update, and its GIN index.
+# Other databases use the in-process index of product.search.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'french_unaccent') THEN
+            CREATE TEXT SEARCH CONFIGURATION french_unaccent (COPY = french);
+            ALTER TEXT SEARCH CONFIGURATION french_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+        END IF;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('french_unaccent', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('french_unaccent', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER product_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, description ON product_product
+        FOR EACH ROW EXECUTE FUNCTION product_search_vector_update()
+    """,
+    "UPDATE product_product SET name = name",
+    "CREATE INDEX product_search_vector_gin ON product_product USING gin (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS product_search_vector_gin",
+    "DROP TRIGGER IF EXISTS product_search_vector_trigger ON product_product",
+    "DROP FUNCTION IF EXISTS product_search_vector_update()",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS french_unaccent",
+]
+
+
+def run_on_postgres(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgres(POSTGRES_FORWARD), run_on_postgres(POSTGRES_BACKWARD)),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+from django.db.models import Count
+
+PENDING = 'En cours'
+CANCELLED = 'Annulée'
+# Fields naming a Stripe payment, checked when the historical model has them
+PAYMENT_FIELDS = ('payment_intent_id', 'payment_token')
+
+
+def unique_slug(slug, taken):
+    index = 2
+    while f'{slug}-{index}' in taken:
+        index += 1
+    return f'{slug}-{index}'
+
+
+def report(message):
+    print(f'  0016: {message}')
+
+
+def has_payment(order, fields):
+    return any(getattr(order, field) for field in fields)
+
+
+def deduplicate(apps, schema_editor):
+    """
+    Make the existing rows satisfy the constraints added by 0017:
+    duplicated slugs get a numeric suffix, extra pending orders are
+    cancelled. A pending order tied to a payment is never cancelled: it is
+    the one kept, and if a user has several of them the migration stops
+    so they are settled by hand. Every change is printed.
+    """
+    Category = apps.get_model('product', 'Category')
+    Product = apps.get_model('product', 'Product')
+    Order = apps.get_model('product', 'Order')
+
+    taken = set(Category.objects.values_list('slug', flat=True))
+    duplicates = Category.objects.values('slug').annotate(total=Count('id')).filter(total__gt=1)
+    for row in duplicates:
+        for category in Category.objects.filter(slug=row['slug']).order_by('id')[1:]:
+            slug, category.slug = category.slug, unique_slug(category.slug, taken)
+            taken.add(category.slug)
+            category.save(update_fields=['slug'])
+            report(f'catégorie {category.pk}: slug {slug!r} -> {category.slug!r}')
+
+    duplicates = Product.objects.values('category_id', 'slug').annotate(total=Count('id')).filter(total__gt=1)
+    for row in duplicates:
+        taken = set(Product.objects.filter(category_id=row['category_id']).values_list('slug', flat=True))
+        for product in Product.objects.filter(category_id=row['category_id'], slug=row['slug']).order_by('id')[1:]:
+            slug, product.slug = product.slug, unique_slug(product.slug, taken)
+            taken.add(product.slug)
+            product.save(update_fields=['slug'])
+            report(f'produit {product.pk}: slug {slug!r} -> {product.slug!r}')
+
+    fields = [field for field in PAYMENT_FIELDS if any(f.name == field for f in Order._meta.get_fields())]
+    duplicates = Order.objects.filter(status=PENDING).values('user_id').annotate(total=Count('order_id')).filter(total__gt=1)
+    for row in duplicates:
+        orders = list(Order.objects.filter(user_id=row['user_id'], status=PENDING).order_by('-created_at'))
+        paid = [order for order in orders if has_payment(order, fields)]
+        if len(paid) > 1:
+            raise RuntimeError(
+                f"L'utilisateur {row['user_id']} a plusieurs commandes en cours liées à un paiement "
+                f"({', '.join(str(order.pk) for order in paid)}): à régler avant de migrer"
+            )
+        kept = paid[0] if paid else orders[0]
+        cancelled = [order.pk for order in orders if order.pk != kept.pk]
+        Order.objects.filter(pk__in=cancelled).update(status=CANCELLED)
+        for pk in cancelled:
+            report(f"commande {pk} annulée, la commande {kept.pk} reste en cours (utilisateur {row['user_id']})")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0015_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+    ]
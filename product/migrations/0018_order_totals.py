@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:50
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Order = apps.get_model('product', 'Order')
+    OrderItem = apps.get_model('product', 'OrderItem')
+
+    items = OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+    total = items.annotate(total=Sum(F('quantity') * F('product__price'))).values('total')
+    count = items.annotate(count=Sum('quantity')).values('count')
+    Order.objects.update(
+        total_price=Coalesce(Subquery(total), Value(Decimal('0.00')), output_field=models.DecimalField()),
+        item_count=Coalesce(Subquery(count), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0017_hot_path_indexes_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
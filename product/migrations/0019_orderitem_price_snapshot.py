@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_prices(apps, schema_editor):
+    OrderItem = apps.get_model('product', 'OrderItem')
+    Product = apps.get_model('product', 'Product')
+
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.update(
+        product_name=Subquery(product.values('name')[:1]),
+        unit_price=Subquery(product.values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0018_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=6, null=True),
+        ),
+        migrations.RunPython(copy_product_prices, migrations.RunPython.noop),
+    ]
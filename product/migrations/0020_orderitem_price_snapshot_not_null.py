@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Separate from 0019: PostgreSQL refuses to ALTER a table
+    updated earlier in the same transaction
+    """
+
+    dependencies = [
+        ('product', '0019_orderitem_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(editable=False, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=6),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0020_orderitem_price_snapshot_not_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('event_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('En attente', 'Queued'), ('En cours', 'Running'), ('Terminé', 'Done'), ('Échec', 'Failed')], default='En attente', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('run_after',),
+                'indexes': [models.Index(fields=['status', 'run_after'], name='product_web_status_1a9f06_idx')],
+            },
+        ),
+    ]
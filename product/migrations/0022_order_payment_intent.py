@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0021_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_intent_amount',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+    ]
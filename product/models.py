@@ -1,21 +1,29 @@
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 import uuid
 import random
+from decimal import Decimal
 from cloudinary.models import CloudinaryField
-import cloudinary.uploader
+from django.contrib.postgres.search import SearchVectorField
 
 from django.core.files import File
-from django.db import models
-from pathlib import Path
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from user.models import MyUser
+from .pipeline import ImagePipeline, is_variant
+from .uploads import upload_outputs
 
-FONT_PATH = Path(__file__).resolve().parent / 'font' / 'open_sans.ttf'
+# Originals are kept on the local disk until a worker has processed them
+local_storage = FileSystemStorage()
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
-    slug = models.SlugField()
+    slug = models.SlugField(unique=True)
+    # Bumped whenever one of its products changes, used for ETags
+    version = models.PositiveIntegerField(default=0, editable=False)
+    last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('name',)
@@ -25,8 +33,46 @@ class Category(models.Model):
 
     def get_absolute_url(self):
         return f'/{self.slug}/'
+
+    def save(self, *args, **kwargs):
+        """
+        The name is shown on product pages, so saving an existing category bumps
+        its version too. The bump is done in the database: a stale instance
+        never writes an old version back.
+        """
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        kwargs['update_fields'] = {*update_fields, 'version'}
+        self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+    @classmethod
+    def touch(cls, *category_ids):
+        """
+        Mark the categories as modified without loading them
+        """
+        return cls.objects.filter(pk__in=category_ids).update(
+            version=models.F('version') + 1,
+            last_modified=timezone.now()
+        )
     
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        # The tsvector is only used inside the database, never load it
+        return super().get_queryset().defer('search_vector')
+
 class Product(models.Model):
+    class ProcessingStatus(models.TextChoices):
+        PENDING = 'En attente'
+        PROCESSING = 'En cours'
+        DONE = 'Terminé'
+        FAILED = 'Échec'
+
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     slug = models.SlugField()
@@ -34,10 +80,31 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
     image = CloudinaryField(folder='watermarked/', blank=True, null=True)
     thumbnail = CloudinaryField(folder='thumbnails/', blank=True, null=True)
+    original = models.ImageField(upload_to='originals/', storage=local_storage, blank=True, null=True, editable=False)
+    processing_status = models.CharField(
+        max_length=10,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.DONE,
+        editable=False
+    )
     date_added = models.DateTimeField(auto_now_add=True)
+    # Filled by a database trigger on PostgreSQL, see product.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductManager()
 
     class Meta:
         ordering = ('-date_added',)
+        # Keyset pagination of SearchProduct: (key, id) for each ordering
+        indexes = [
+            models.Index(fields=['-date_added', '-id'], name='product_date_added_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
+        # ProductDetail looks products up by (category, slug)
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'slug'], name='product_category_slug_uniq'),
+        ]
 
     def __str__(self):
         return self.name
@@ -45,84 +112,109 @@ class Product(models.Model):
     def get_absolute_url(self):
         return f'/{self.category.slug}/{self.slug}/'
             
-    def make_thumbnail(self, image, size=(300, 200)):
+    def process_images(self):
         """
-        Generate a thumbnail from the original watermarked image.
+        Resize and watermark the local original, then upload it to cloudinary.
+        Run by the image worker, never in the request.
         """
-        img = Image.open(image)
-        img.thumbnail(size, Image.LANCZOS)
-
-        thumb_io = BytesIO()
-        img.save(thumb_io, format='PNG', quality=85)
-        thumb_io.seek(0)
+        with self.original.open('rb') as original:
+            pipeline = ImagePipeline(original)
+            outputs = pipeline.run()
 
-        result = cloudinary.uploader.upload(thumb_io, folder='thumbnails/')
-        return result['secure_url']
+        urls = upload_outputs(outputs)
+        self.image = urls['image']
+        self.thumbnail = urls['thumbnail']
 
-    def resize_image(self, image, size=(600, 800)):
-        """
-        Resize the uploaded image to display constant image
-        """
-        img = Image.open(image)
-        img = img.resize(size, Image.LANCZOS)
+        self.processing_status = self.ProcessingStatus.DONE
+        with transaction.atomic():
+            self.save(update_fields=['image', 'thumbnail', 'processing_status'])
+            ProductImageVariant.replace(self, outputs, urls)
+        return pipeline
 
-        img_io = BytesIO()
-        img.save(img_io, format='PNG', quality=85)
-        img_io.seek(0)
-
-        return img_io
-    
-    def add_watermark(self, image):
+    def save(self, *args, **kwargs):
         """
-        Add a watermark to the image and upload it to Cloudinary
+        Keep the uploaded image locally and queue the processing job,
+        so the admin request returns right away
         """
-        img = Image.open(image).convert('RGBA')
-        watermark_text = "@nathalielncle"
-        font = ImageFont.truetype(FONT_PATH, 50)
+        new_upload = isinstance(self.image, UploadedFile)
+        if new_upload:
+            self.original.save(self.image.name, self.image, save=False)
+            self.image = None
+            self.thumbnail = None
+            self.processing_status = self.ProcessingStatus.PENDING
 
-        width, height = img.size
-
-        # Create a single watermark tile
-        text_bbox = font.getbbox(watermark_text)
-        tile_size = (text_bbox[2] + 20, text_bbox[3] + 20)
-        tile = Image.new("RGBA", tile_size, (0, 0, 0, 0))
+        super().save(*args, **kwargs)
 
-        draw = ImageDraw.Draw(tile)
-        draw.text((10, 10), watermark_text, font=font, fill=(51, 51, 51))
-        tile = tile.rotate(-30, expand=True)  # Rotate before tiling
-        
-        # Create watermark layer
-        watermark = Image.new('RGBA', img.size, (0, 0, 0, 0))
-        for x in range(0, width, tile.width + 50):
-            for y in range(0, height, tile.height + 50):
-                watermark.paste(tile, (x, y), tile)
+        if new_upload:
+            ImageJob.objects.create(product=self)
 
+class ProductImageVariant(models.Model):
+    product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    size = models.PositiveIntegerField(help_text="Size in bytes")
+    url = models.URLField(max_length=500)
 
-        # Adding the watermark layer to the original image
-        watermarked_img = Image.alpha_composite(img, watermark).convert('RGB')
+    class Meta:
+        ordering = ('format', 'width')
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'width', 'format'], name='unique_product_variant'),
+        ]
 
-        temp_img = BytesIO()
-        watermarked_img.save(temp_img, 'PNG')
-        temp_img.seek(0)
+    def __str__(self):
+        return f"{self.product} {self.width}w {self.format}"
 
-        return temp_img
-        
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_outputs(cls, product, outputs, urls):
         """
-        Resize and watermark before uploading to cloudinary
+        Build (unsaved) variants from the pipeline outputs and their uploaded urls
         """
-        if self.image and not self.pk:
-            resized_img = self.resize_image(self.image)
-            watermarked_img = self.add_watermark(resized_img)
+        return [
+            cls(
+                product=product,
+                width=output.width,
+                height=output.height,
+                format=output.format,
+                size=len(output.data),
+                url=urls[name],
+            )
+            for name, output in outputs.items()
+            if is_variant(name)
+        ]
 
-            img_result = cloudinary.uploader.upload(watermarked_img, folder='watermarked/')
-            self.image = img_result['secure_url']
+    @classmethod
+    def replace(cls, product, outputs, urls):
+        cls.objects.filter(product=product).delete()
+        return cls.objects.bulk_create(cls.from_outputs(product, outputs, urls))
 
-            thumbnail_img = self.make_thumbnail(watermarked_img)
-            thumb_result = cloudinary.uploader.upload(thumbnail_img, folder='thumbnails/')
-            self.thumbnail = thumb_result['secure_url']
+class ImageJob(models.Model):
+    class StatusChoices(models.TextChoices):
+        QUEUED = 'En attente'
+        RUNNING = 'En cours'
+        DONE = 'Terminé'
+        FAILED = 'Échec'
 
-        super().save(*args, **kwargs)
+    product = models.ForeignKey(Product, related_name='image_jobs', on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10,
+        choices=StatusChoices.choices,
+        default=StatusChoices.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('run_after',)
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"Image job #{self.pk} ({self.product})"
 
 class Order(models.Model):
     class StatusChoices(models.TextChoices):
@@ -141,13 +233,49 @@ class Order(models.Model):
     products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     shipping_details = models.JSONField(null=True, blank=True)
     payment_token = models.CharField(max_length=100, null=True, blank=True)
+    # Stripe PaymentIntent reused by every checkout attempt, and the amount (cents) it was created for
+    payment_intent_id = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    payment_intent_amount = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Maintained by update_totals() whenever the items change
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            models.Index(fields=['user', '-created_at'], name='order_user_created_at_idx'),
+            models.Index(fields=['-created_at'], name='order_created_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(status='En cours'),  # StatusChoices.PENDING
+                name='order_one_pending_per_user',
+                violation_error_message="Une commande est déjà en cours",
+            ),
+        ]
 
     def __str__(self):
         return f"Commande #{self.order_id}"
 
+    def update_totals(self):
+        """
+        Sum the items in the database and store the result on the order,
+        call it inside the transaction that changed the items
+        """
+        totals = self.items.aggregate(
+            total_price=Coalesce(
+                models.Sum(models.F('quantity') * models.F('unit_price')),
+                models.Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            item_count=Coalesce(models.Sum('quantity'), 0),
+        )
+        Order.objects.filter(pk=self.pk).update(**totals)
+        self.total_price = totals['total_price']
+        self.item_count = totals['item_count']
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order,
@@ -156,7 +284,56 @@ class OrderItem(models.Model):
     )
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Copied from the product when the line is created: later price
+    # changes do not alter the order, and reads need no product join
+    product_name = models.CharField(max_length=255, editable=False)
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2, editable=False)
+
+    @classmethod
+    def from_product(cls, order, product, quantity):
+        return cls(order=order, product=product, quantity=quantity, product_name=product.name, unit_price=product.price)
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.product_name = self.product.name
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
 
     @property
     def item_subtotal(self):
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
+
+class WebhookEvent(models.Model):
+    """
+    Stripe events, stored as soon as they are received and applied later
+    by the webhook worker. The Stripe id as primary key makes retries no-ops.
+    """
+    class StatusChoices(models.TextChoices):
+        QUEUED = 'En attente'
+        RUNNING = 'En cours'
+        DONE = 'Terminé'
+        FAILED = 'Échec'
+
+    event_id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=10,
+        choices=StatusChoices.choices,
+        default=StatusChoices.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('run_after',)
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
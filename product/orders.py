@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Order
+
+PENDING_ORDER_TIMEOUT = getattr(settings, 'PENDING_ORDER_TIMEOUT', 600)
+
+
+def pending_key(user_id):
+    return f'order:pending:{user_id}'
+
+
+def pending_order(user, fields=()):
+    """
+    The user's pending order, or None, always confirmed by the database:
+    the default cache can be local to each process, so neither an order
+    created nor a status changed in another process (a web worker, the
+    webhook worker) reaches it. A cached id only turns the search into a
+    primary key lookup; "no pending order" is never cached.
+    """
+    pending = Order.objects.filter(user=user, status=Order.StatusChoices.PENDING)
+    if fields:
+        pending = pending.only(*fields)
+    order_id = cache.get(pending_key(user.pk))
+    if order_id is not None:
+        order = pending.filter(pk=order_id).first()
+        if order is not None:
+            return order
+    order = pending.first()
+    if order is not None:
+        cache.set(pending_key(user.pk), str(order.pk), PENDING_ORDER_TIMEOUT)
+    elif order_id is not None:
+        cache.delete(pending_key(user.pk))
+    return order
+
+
+def pending_order_id(user):
+    order = pending_order(user, fields=['order_id'])
+    return None if order is None else str(order.pk)
+
+
+def forget_pending_order(user_id):
+    """
+    Wait for the commit, otherwise a concurrent request could cache the old answer again
+    """
+    transaction.on_commit(lambda: cache.delete(pending_key(user_id)))
+
+
+def remember_pending_order(order):
+    transaction.on_commit(
+        lambda: cache.set(pending_key(order.user_id), str(order.order_id), PENDING_ORDER_TIMEOUT)
+    )
@@ -0,0 +1,158 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .search import rank_field
+
+
+class CategoryProductsPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-date_added'
+
+
+class StaffOrderPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-created_at'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination: each page starts WHERE (key, id) is past the
+    last row of the previous page, so page 500 costs the same as page 1
+    and there is no COUNT(*).
+
+    The `ordering` query parameter accepts the view's `ordering_fields`
+    (with an optional '-'), `id` is always added as a tie breaker.
+    A queryset annotated with a search `rank` defaults to '-rank'.
+    Cursors are opaque base64 tokens.
+    """
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    default_ordering = '-date_added'
+    invalid_cursor_message = "Curseur invalide"
+
+    def get_ordering(self, request, view, queryset):
+        default = '-rank' if 'rank' in queryset.query.annotations else self.default_ordering
+        ordering = request.query_params.get(self.ordering_param, default)
+        allowed = set(getattr(view, 'ordering_fields', [])) | {default.lstrip('-'), self.default_ordering.lstrip('-')}
+        if ordering.lstrip('-') not in allowed:
+            return default
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, ordering, row, reverse):
+        field = ordering.lstrip('-')
+        payload = {'o': ordering, 'v': [str(getattr(row, field)), row.pk], 'r': reverse}
+        return urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def cursor_field(self, queryset, ordering):
+        field = ordering.lstrip('-')
+        if field == 'rank':
+            return rank_field()
+        return queryset.model._meta.get_field(field)
+
+    def decode_cursor(self, request, ordering, queryset):
+        """
+        (value, pk, reverse), converted with the ordering field so that
+        a tampered cursor is a 404 and never reaches the query
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if payload['o'] != ordering:
+                raise ValueError
+            value, pk = payload['v']
+            value = self.cursor_field(queryset, ordering).to_python(value)
+            if value is None or isinstance(pk, bool):
+                raise ValueError
+            pk = int(pk)
+            reverse = bool(payload['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, reverse
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, view, queryset)
+        self.size = self.get_page_size(request)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+
+        cursor = self.decode_cursor(request, self.ordering, queryset)
+        reverse = bool(cursor and cursor[2])
+        # Walking backwards means reading the same keyset in the opposite direction
+        seek_descending = descending != reverse
+        prefix = '-' if seek_descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+
+        if cursor:
+            value, pk, _ = cursor
+            lookup = 'lt' if seek_descending else 'gt'
+            # The leading `field <= value` bound lets the database range scan the (field, id) index
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}e': value}),
+                Q(**{f'{field}__{lookup}': value}) | Q(**{f'id__{lookup}': pk}),
+            )
+
+        rows = list(queryset[:self.size + 1])
+        has_more = len(rows) > self.size
+        rows = rows[:self.size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (cursor is not None) if not reverse else has_more
+        return rows
+
+    def get_next_link(self):
+        if not self.page or not self.has_next:
+            return None
+        cursor = self.encode_cursor(self.ordering, self.page[-1], reverse=False)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.page or not self.has_previous:
+            return None
+        cursor = self.encode_cursor(self.ordering, self.page[0], reverse=True)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,98 @@
+import threading
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Point the SDK at another server, e.g. the local stub (product.stripe_stub)
+STRIPE_API_BASE = getattr(settings, 'STRIPE_API_BASE', None)
+STRIPE_HTTP_POOL_SIZE = getattr(settings, 'STRIPE_HTTP_POOL_SIZE', 10)
+STRIPE_HTTP_TIMEOUT = getattr(settings, 'STRIPE_HTTP_TIMEOUT', 20)
+CLIENT_SECRET_TIMEOUT = 3600
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    One keep-alive connection pool shared by every Stripe call of the process,
+    instead of a TLS handshake per request
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=STRIPE_HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _client = stripe.RequestsClient(session=session, timeout=STRIPE_HTTP_TIMEOUT)
+            stripe.default_http_client = _client
+            if STRIPE_API_BASE:
+                stripe.api_base = STRIPE_API_BASE
+    return _client
+
+
+def intent_amount(order):
+    return int(order.total_price * 100)
+
+
+def secret_key(intent_id):
+    return f'stripe:client-secret:{intent_id}'
+
+
+def create_intent(order, shipping):
+    """
+    Two concurrent first calls for the same order share the idempotency key,
+    so Stripe creates one intent. The key names the intent being replaced,
+    if any, so a canceled intent is never returned again.
+    """
+    amount = intent_amount(order)
+    intent = stripe.PaymentIntent.create(
+        amount=amount,
+        currency='eur',
+        metadata={'order_id': str(order.order_id)},
+        shipping=shipping,
+        automatic_payment_methods={
+            'enabled': True,
+        },
+        idempotency_key=f'order-{order.order_id}-{amount}-{order.payment_intent_id or "new"}',
+    )
+    order.payment_intent_id = intent['id']
+    order.payment_intent_amount = intent['amount']
+    return intent
+
+
+def payment_client_secret(order, shipping):
+    """
+    Client secret of the order's PaymentIntent. The intent is created once;
+    later calls reuse it, and only call Stripe to change its amount or
+    shipping, or when its secret is no longer cached.
+    The caller saves the order (payment_intent_id, payment_intent_amount).
+    """
+    get_http_client()
+    amount = intent_amount(order)
+    if order.payment_intent_id is None:
+        intent = create_intent(order, shipping)
+    elif order.payment_intent_amount != amount or order.shipping_details != shipping:
+        try:
+            intent = stripe.PaymentIntent.modify(order.payment_intent_id, amount=amount, shipping=shipping)
+            order.payment_intent_amount = intent['amount']
+        except stripe.error.InvalidRequestError:
+            # A canceled intent can no longer be updated
+            if stripe.PaymentIntent.retrieve(order.payment_intent_id)['status'] != 'canceled':
+                raise
+            intent = create_intent(order, shipping)
+    else:
+        client_secret = cache.get(secret_key(order.payment_intent_id))
+        if client_secret is not None:
+            return client_secret
+        intent = stripe.PaymentIntent.retrieve(order.payment_intent_id)
+        if intent['status'] == 'canceled':
+            intent = create_intent(order, shipping)
+
+    cache.set(secret_key(intent['id']), intent['client_secret'], CLIENT_SECRET_TIMEOUT)
+    return intent['client_secret']
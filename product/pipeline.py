@@ -0,0 +1,167 @@
+from collections import namedtuple
+from io import BytesIO
+import time
+
+from PIL import Image, features
+
+from django.conf import settings
+
+from .watermark import apply_watermark
+
+IMAGE_SIZE = (600, 800)
+THUMBNAIL_SIZE = (300, 200)
+
+# PNG ignores `quality`, so outputs use a lossy format with real settings
+DEFAULT_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+OUTPUT_FORMATS = getattr(settings, 'PRODUCT_IMAGE_FORMATS', {
+    'image': {'format': DEFAULT_FORMAT, 'quality': 85},
+    'thumbnail': {'format': DEFAULT_FORMAT, 'quality': 80},
+})
+
+# Responsive variants (srcset), WebP for modern clients and a JPEG fallback
+VARIANT_WIDTHS = getattr(settings, 'PRODUCT_IMAGE_VARIANT_WIDTHS', (200, 400, 600))
+VARIANT_FORMATS = getattr(settings, 'PRODUCT_IMAGE_VARIANT_FORMATS', [
+    {'format': DEFAULT_FORMAT, 'quality': 80},
+    {'format': 'JPEG', 'quality': 80},
+])
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+
+EncodedImage = namedtuple('EncodedImage', ['name', 'data', 'format', 'width', 'height'])
+StageReport = namedtuple('StageReport', ['stage', 'ms', 'bytes'])
+
+
+def encode(img, format, quality=None):
+    """
+    Encode a PIL image once, with options that actually apply to the format
+    """
+    options = {}
+    if format == 'JPEG':
+        options = {'quality': quality or 85, 'optimize': True, 'progressive': True}
+    elif format == 'WEBP':
+        options = {'quality': quality or 85, 'method': 4}
+    elif format == 'PNG':
+        options = {'optimize': True}
+
+    buffer = BytesIO()
+    img.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+class ImagePipeline:
+    """
+    Carry a single decoded image through resize -> watermark -> thumbnail
+    -> responsive variants and encode each output only once.
+
+        pipeline = ImagePipeline(file)
+        outputs = pipeline.run()   # {'image': EncodedImage, 'thumbnail': ..., 'variant_400_webp': ...}
+        pipeline.report            # time and bytes per stage
+    """
+
+    def __init__(self, source, size=IMAGE_SIZE, thumbnail_size=THUMBNAIL_SIZE, formats=None,
+                 variant_widths=VARIANT_WIDTHS, variant_formats=None):
+        self.source = source
+        self.size = size
+        self.thumbnail_size = thumbnail_size
+        self.formats = formats or OUTPUT_FORMATS
+        self.variant_widths = variant_widths
+        self.variant_formats = variant_formats or VARIANT_FORMATS
+        self.report = []
+        self.outputs = {}
+
+    def _stage(self, stage, start, nbytes=0):
+        self.report.append(StageReport(stage, (time.perf_counter() - start) * 1000, nbytes))
+
+    def decode(self):
+        start = time.perf_counter()
+        img = Image.open(self.source)
+        # Let JPEG decode at a reduced scale when the source is much larger
+        img.draft('RGB', self.size)
+        img = img.convert('RGB')
+        self._stage('decode', start)
+        return img
+
+    def resize(self, img):
+        start = time.perf_counter()
+        img = img.resize(self.size, Image.LANCZOS)
+        self._stage('resize', start)
+        return img
+
+    def watermark(self, img):
+        start = time.perf_counter()
+        img = apply_watermark(img)
+        self._stage('watermark', start)
+        return img
+
+    def thumbnail(self, img):
+        start = time.perf_counter()
+        thumb = img.copy()
+        thumb.thumbnail(self.thumbnail_size, Image.LANCZOS)
+        self._stage('thumbnail', start)
+        return thumb
+
+    def encode(self, name, img, options=None):
+        start = time.perf_counter()
+        options = options or self.formats[name]
+        data = encode(img, options['format'], options.get('quality'))
+        self._stage(f'encode:{name}', start, len(data))
+        self.outputs[name] = EncodedImage(name, data, options['format'], img.width, img.height)
+        return self.outputs[name]
+
+    def variants(self, img):
+        """
+        Encode the watermarked image at every variant width it can cover
+        """
+        for width in self.variant_widths:
+            if width > img.width:
+                continue
+            start = time.perf_counter()
+            height = round(img.height * width / img.width)
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            self._stage(f'variant:{width}', start)
+            for options in self.variant_formats:
+                self.encode(variant_name(width, options['format']), resized, options)
+
+    def run(self, watermark=True, variants_only=False):
+        """
+        `watermark=False` skips resize and watermark, for sources
+        that are already the final watermarked image (backfills).
+        `variants_only=True` does not encode the image and thumbnail.
+        """
+        img = self.decode()
+        if watermark:
+            img = self.watermark(self.resize(img))
+        if not variants_only:
+            self.encode('image', img)
+            self.encode('thumbnail', self.thumbnail(img))
+        self.variants(img)
+        return self.outputs
+
+    def summary(self):
+        return ', '.join(
+            f"{report.stage} {report.ms:.1f}ms" + (f" {report.bytes}B" if report.bytes else '')
+            for report in self.report
+        )
+
+
+def variant_name(width, format):
+    return f'variant_{width}_{EXTENSIONS[format]}'
+
+
+def is_variant(name):
+    return name.startswith('variant_')
+
+
+def process_file(path):
+    """
+    Run the pipeline on an image file. Top level so it can be sent to a process pool.
+    """
+    with open(path, 'rb') as source:
+        return ImagePipeline(source).run()
+
+
+def process_variants(data, watermark=True):
+    """
+    Only the responsive variants of raw image bytes, for process pools
+    """
+    return ImagePipeline(BytesIO(data)).run(watermark=watermark, variants_only=True)
@@ -0,0 +1,209 @@
+from collections import defaultdict
+from decimal import Decimal
+import math
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+# Postgres text search configuration created by migration 0015: french + unaccent
+SEARCH_CONFIG = 'french_unaccent'
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+# Ranks are fixed precision: the keyset cursor sends them back as text, a
+# float (float4 for ts_rank) would not compare equal to its own string
+RANK_DECIMAL_PLACES = 6
+
+
+def rank_field():
+    return DecimalField(max_digits=20, decimal_places=RANK_DECIMAL_PLACES)
+
+
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+STOPWORDS = {
+    'a', 'au', 'aux', 'avec', 'ce', 'ces', 'd', 'dans', 'de', 'des', 'du', 'en', 'et', 'il', 'j',
+    'l', 'la', 'le', 'les', 'leur', 'mon', 'ma', 'mes', 'n', 'ne', 'ou', 'par', 'pas', 'pour',
+    'qu', 'que', 'qui', 's', 'sa', 'se', 'son', 'ses', 'sur', 't', 'un', 'une',
+}
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def unaccent(text):
+    return ''.join(
+        char for char in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(char)
+    )
+
+
+def stem(token):
+    """
+    Light French stemmer: plurals and the most common endings,
+    so 'dessins', 'dessinée' and 'dessiner' all become 'dessin'
+    """
+    if len(token) > 4 and token.endswith('aux'):
+        return token[:-3] + 'al'
+    if len(token) > 3 and token[-1] in 'sx':
+        token = token[:-1]
+    for suffix in ('ement', 'ee', 'er', 'e'):
+        if len(token) - len(suffix) >= 4 and token.endswith(suffix):
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """
+    Lowercase, unaccent, drop stop words and stem
+    """
+    return [
+        stem(token)
+        for token in TOKEN_RE.findall(unaccent((text or '').lower()))
+        if token not in STOPWORDS
+    ]
+
+
+def rank_by(queryset, scores):
+    """
+    Keep the ranked ids only, with their score as a `rank` annotation.
+    Ids sharing a score share a WHEN, which keeps the CASE short.
+    """
+    if not scores:
+        return queryset.none()
+    groups = defaultdict(list)
+    for pk, score in scores.items():
+        groups[score].append(pk)
+    return queryset.filter(pk__in=scores).annotate(rank=Case(
+        *[When(pk__in=pks, then=Value(Decimal(f'{score:.{RANK_DECIMAL_PLACES}f}'))) for score, pks in groups.items()],
+        output_field=rank_field(),
+    ))
+
+
+class PostgresSearchBackend:
+    """
+    tsvector column maintained by a trigger, GIN index, ts_rank ordering
+    """
+
+    def search(self, queryset, text):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), rank_field())
+        )
+
+    def update(self, *products):
+        """The database trigger already did it"""
+
+    def remove(self, *product_ids):
+        pass
+
+    def reset(self):
+        pass
+
+
+class InvertedIndexBackend:
+    """
+    In-process inverted index for SQLite dev: term -> {product id: weighted
+    frequency}. Built on the first search, then kept up to date by signals.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.postings = None
+            self.documents = {}
+
+    def build(self):
+        from .models import Product
+
+        postings = defaultdict(dict)
+        documents = {}
+        for pk, name, description in Product.objects.values_list('pk', 'name', 'description').iterator(chunk_size=2000):
+            documents[pk] = self._index(postings, pk, name, description)
+        self.postings, self.documents = postings, documents
+
+    def _index(self, postings, pk, name, description):
+        weights = defaultdict(float)
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+        for token, weight in weights.items():
+            postings[token][pk] = weight
+        return list(weights)
+
+    def _remove(self, pk):
+        for token in self.documents.pop(pk, []):
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(pk, None)
+                if not posting:
+                    del self.postings[token]
+
+    def update(self, *products):
+        with self.lock:
+            if self.postings is None:
+                return
+            for product in products:
+                self._remove(product.pk)
+                self.documents[product.pk] = self._index(self.postings, product.pk, product.name, product.description)
+
+    def remove(self, *product_ids):
+        with self.lock:
+            if self.postings is None:
+                return
+            for pk in product_ids:
+                self._remove(pk)
+
+    def scores(self, text):
+        """
+        Every term must match; score = sum of idf * weighted frequency
+        """
+        terms = set(tokenize(text))
+        if not terms:
+            return {}
+        with self.lock:
+            if self.postings is None:
+                self.build()
+            postings = [self.postings.get(term, {}) for term in terms]
+            total = len(self.documents)
+        if not all(postings):
+            return {}
+
+        postings.sort(key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        scores = {
+            pk: sum(math.log(1 + total / len(posting)) * posting[pk] for posting in postings)
+            for pk in matches
+        }
+        best = sorted(scores, key=scores.get, reverse=True)[:MAX_RESULTS]
+        return {pk: round(scores[pk], 6) for pk in best}
+
+    def search(self, queryset, text):
+        return rank_by(queryset, self.scores(text))
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        backend = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend is None:
+            backend = (
+                'product.search.PostgresSearchBackend'
+                if connection.vendor == 'postgresql'
+                else 'product.search.InvertedIndexBackend'
+            )
+        _backend = import_string(backend)()
+    return _backend
@@ -1,11 +1,25 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from .models import Category, Product, OrderItem, Order
+from .models import Category, Product, ProductImageVariant, OrderItem, Order
+from .orders import pending_order, remember_pending_order
+
+class ProductImageVariantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductImageVariant
+        fields = (
+            'url',
+            'width',
+            'height',
+            'format',
+            'size',
+        )
 
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     image = serializers.SerializerMethodField()
     thumbnail = serializers.SerializerMethodField()
+    srcset = ProductImageVariantSerializer(source='variants', many=True, read_only=True)
 
     def get_image(self, obj):
         """
@@ -27,32 +41,74 @@ class ProductSerializer(serializers.ModelSerializer):
             'price',
             'image',
             'thumbnail',
+            'srcset',
         )
 
-class CategorySerializer(serializers.ModelSerializer):
-    products = ProductSerializer(many=True)
+class ProductListSerializer(ProductSerializer):
+    """Products in a listing: no description"""
+    class Meta(ProductSerializer.Meta):
+        fields = tuple(field for field in ProductSerializer.Meta.fields if field != 'description')
 
+class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = (
             'id',
             'name',
             'get_absolute_url',
-            'products',
         )
 
+class ProductIdField(serializers.PrimaryKeyRelatedField):
+    """
+    Only checks the type: the products of a whole cart
+    are loaded in one query by OrderItemListSerializer
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        """
+        Resolve every product with a single in_bulk query
+        and merge the lines of a same product
+        """
+        items = super().to_internal_value(data)
+        products = Product.objects.in_bulk({item['product'] for item in items})
+
+        errors = [{} for _ in items]
+        for item, error in zip(items, errors):
+            if item['product'] not in products:
+                message = self.child.fields['product'].error_messages['does_not_exist']
+                error['product'] = [message.format(pk_value=item['product'])]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        merged = {}
+        for item in items:
+            if item['product'] in merged:
+                merged[item['product']]['quantity'] += item['quantity']
+            else:
+                merged[item['product']] = {**item, 'product': products[item['product']]}
+        return list(merged.values())
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_name = serializers.CharField(read_only=True)
     product_price = serializers.DecimalField(
         max_digits=10,
         decimal_places=2,
-        source='product.price',
+        source='unit_price',
         read_only=True,
         )
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = ProductIdField(queryset=Product.objects.all())
     
     class Meta:
         model = OrderItem
+        list_serializer_class = OrderItemListSerializer
         fields = (
             'product',
             'product_name',
@@ -66,11 +122,17 @@ class OrderSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     items = OrderItemSerializer(many=True)
     payment_token = serializers.CharField(read_only=True)
-    total_price = serializers.SerializerMethodField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, coerce_to_string=False)
+    item_count = serializers.IntegerField(read_only=True)
 
-    def get_total_price(self, obj):
-        order_items = obj.items.all()
-        return sum(order_item.item_subtotal for order_item in order_items)
+    def __init__(self, *args, fields=None, **kwargs):
+        """
+        `fields`: only keep these fields in the output (sparse listings)
+        """
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
     
     class Meta:
         model = Order
@@ -82,26 +144,70 @@ class OrderSerializer(serializers.ModelSerializer):
             'items',
             'payment_token',
             'total_price',
+            'item_count',
         )
 
     def create(self, validated_data):
+        """
+        One pending order per user: a request that loses the race against a
+        concurrent one hits the `order_one_pending_per_user` constraint and
+        gets the order the other request created
+        """
         user = validated_data.get('user')
-        existing_order = Order.objects.filter(user=user, status=Order.StatusChoices.PENDING).first()
-
+        existing_order = pending_order(user)
         if existing_order:
             return existing_order
-        
-        items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
 
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        items_data = validated_data.pop('items')
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(**validated_data)
+                OrderItem.objects.bulk_create([
+                    OrderItem.from_product(order, item_data['product'], item_data['quantity'])
+                    for item_data in items_data
+                ])
+                order.update_totals()
+        except IntegrityError:
+            existing_order = Order.objects.filter(user=user, status=Order.StatusChoices.PENDING).first()
+            if existing_order is None:
+                raise
+            remember_pending_order(existing_order)
+            return existing_order
         return order
 
     def update(self, instance, validated_data):
-        instance.items.all().delete()
+        """
+        Only write the lines that changed: new products are inserted,
+        changed quantities updated and missing products deleted
+        """
+        items_data = validated_data.pop('items', None)
+        with transaction.atomic():
+            if items_data is not None:
+                self.update_items(instance, items_data)
+                instance.update_totals()
+            return super().update(instance, validated_data)
+
+    def update_items(self, order, items_data):
+        current = {item.product_id: item for item in OrderItem.objects.filter(order=order)}
+        wanted = {item_data['product'].pk: item_data for item_data in items_data}
+
+        removed = [item.pk for product_id, item in current.items() if product_id not in wanted]
+        if removed:
+            OrderItem.objects.filter(pk__in=removed).delete()
+
+        changed = []
+        for product_id, item_data in wanted.items():
+            item = current.get(product_id)
+            if item is not None and item.quantity != item_data['quantity']:
+                item.quantity = item_data['quantity']
+                changed.append(item)
+        if changed:
+            OrderItem.objects.bulk_update(changed, ['quantity'])
 
-        items_data = validated_data.pop('items', [])
-        for item_data in items_data:
-            OrderItem.objects.update_or_create(order=instance, **item_data)
-        return super().update(instance, validated_data)
\ No newline at end of file
+        added = [
+            OrderItem.from_product(order, item_data['product'], item_data['quantity'])
+            for product_id, item_data in wanted.items()
+            if product_id not in current
+        ]
+        if added:
+            OrderItem.objects.bulk_create(added)
\ No newline at end of file
@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache
+from .autocomplete import get_index as get_autocomplete_index
+from .models import Category, Order, Product
+from .orders import forget_pending_order, remember_pending_order
+from .search import get_search_backend
+
+
+def product_scopes(category_slug, product_slug):
+    return [f'category:{category_slug}', f'product:{category_slug}/{product_slug}']
+
+
+def invalidate_on_commit(*scopes):
+    """
+    Wait for the commit, otherwise a concurrent request could cache
+    the old rows again under the new version
+    """
+    transaction.on_commit(lambda: cache.invalidate(*scopes))
+
+
+def applied_on_commit(bumps):
+    """
+    The autocomplete index of this process already has the change,
+    it only expects the category versions bumped by it
+    """
+    transaction.on_commit(lambda: get_autocomplete_index().applied(bumps))
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_slugs(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the slugs the product had before the save, so its old URLs are invalidated too
+    """
+    instance._previous_scopes = []
+    instance._previous_category_id = None
+    if instance.pk and (update_fields is None or {'slug', 'category'} & set(update_fields)):
+        previous = Product.objects.filter(pk=instance.pk).values_list('category_id', 'category__slug', 'slug').first()
+        if previous:
+            instance._previous_category_id = previous[0]
+            instance._previous_scopes = product_scopes(*previous[1:])
+
+
+# Product fields shown by the catalog endpoints (ProductSerializer, URLs, category)
+CATALOG_FIELDS = {'name', 'slug', 'category', 'description', 'price', 'image', 'thumbnail'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, update_fields=None, **kwargs):
+    """
+    A save limited to other fields (processing_status...) keeps the cached pages.
+    An uploaded image still bumps the version twice: the admin save empties
+    image and thumbnail, then the worker's save fills them, and clients
+    see both states.
+    """
+    if update_fields is not None and not CATALOG_FIELDS & set(update_fields):
+        return
+    applied_on_commit(Category.touch(*{instance.category_id, getattr(instance, '_previous_category_id', None)} - {None}))
+    invalidate_on_commit(
+        'latest',
+        'search',
+        *product_scopes(instance.category.slug, instance.slug),
+        *getattr(instance, '_previous_scopes', []),
+    )
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_slug(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Category.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, created=False, **kwargs):
+    """
+    Product pages show the category name, so they depend on `category-info`
+    """
+    # Category.save() bumped the version, a new or deleted category changes the count (rebuild)
+    if kwargs['signal'] is post_save and not created:
+        applied_on_commit(1)
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)} - {None}
+    invalidate_on_commit(
+        'latest',
+        'search',
+        *[f'category:{slug}' for slug in slugs],
+        *[f'category-info:{slug}' for slug in slugs],
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'description'} & set(update_fields):
+        get_search_backend().update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def update_autocomplete_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'thumbnail'} & set(update_fields):
+        get_autocomplete_index().update_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_autocomplete_product(sender, instance, **kwargs):
+    get_autocomplete_index().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def update_autocomplete_category(sender, instance, **kwargs):
+    get_autocomplete_index().update_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def remove_autocomplete_category(sender, instance, **kwargs):
+    get_autocomplete_index().remove_category(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_pending_order(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if instance.status == Order.StatusChoices.PENDING:
+        remember_pending_order(instance)
+    else:
+        forget_pending_order(instance.user_id)
+
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_pending_order(sender, instance, **kwargs):
+    forget_pending_order(instance.user_id)
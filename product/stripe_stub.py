@@ -0,0 +1,114 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qsl
+
+import stripe
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the SDK connection pool can be observed
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_call()
+
+    def do_POST(self):
+        self.handle_call()
+
+    def handle_call(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+        time.sleep(stub.latency)
+
+        status, body = stub.dispatch(self.command, self.path.split('?')[0], params, self.headers.get('Idempotency-Key'))
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubStripeServer:
+    """
+    Local stand-in for the PaymentIntent endpoints of the Stripe API,
+    with an artificial latency, for offline tests and benchmarks:
+
+        with StubStripeServer(latency=0.05) as server:
+            ...
+            server.calls  # [('POST', '/v1/payment_intents'), ...]
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.connections = 0
+        self.intents = {}
+        self.idempotent = {}
+        self.lock = threading.Lock()
+
+    def dispatch(self, method, path, params, idempotency_key=None):
+        with self.lock:
+            self.calls.append((method, path))
+            parts = path.strip('/').split('/')
+            if parts[:2] != ['v1', 'payment_intents']:
+                return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown path {path}'}}
+
+            if len(parts) == 2 and method == 'POST':
+                if idempotency_key in self.idempotent:
+                    return 200, self.intents[self.idempotent[idempotency_key]]
+                intent_id = f'pi_stub_{len(self.intents) + 1}'
+                if idempotency_key:
+                    self.idempotent[idempotency_key] = intent_id
+                self.intents[intent_id] = {
+                    'id': intent_id,
+                    'object': 'payment_intent',
+                    'amount': int(params['amount']),
+                    'currency': params.get('currency', 'eur'),
+                    'status': 'requires_payment_method',
+                    'client_secret': f'{intent_id}_secret_stub',
+                    'metadata': {key[9:-1]: value for key, value in params.items() if key.startswith('metadata[')},
+                }
+                return 200, self.intents[intent_id]
+
+            intent = self.intents.get(parts[2]) if len(parts) == 3 else None
+            if intent is None:
+                return 404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}}
+            if method == 'POST' and intent['status'] == 'canceled':
+                return 400, {'error': {
+                    'type': 'invalid_request_error', 'code': 'payment_intent_unexpected_state',
+                    'message': 'This PaymentIntent could not be updated because it has a status of canceled',
+                }}
+            if method == 'POST' and 'amount' in params:
+                intent['amount'] = int(params['amount'])
+            return 200, intent
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubStripeHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.previous_api_base = stripe.api_base
+        stripe.api_base = self.url
+        return self
+
+    def __exit__(self, *exc_info):
+        stripe.api_base = self.previous_api_base
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
@@ -1,3 +1,1647 @@
-from django.test import TestCase
+from base64 import urlsafe_b64encode
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+import re
+import shutil
+import threading
+import time
+import tempfile
+import tracemalloc
+import uuid
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from PIL import Image
+
+from django.core.cache import cache as django_cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from user.models import MyUser
+from . import cache as catalog_cache, watermark
+from .jobs import claim_next_job, run_job, run_pending_jobs, MAX_ATTEMPTS
+from .management.commands.bench_watermark import legacy_watermark
+from .models import Category, Product, ProductImageVariant, ImageJob, Order, OrderItem, WebhookEvent
+from .payments import payment_client_secret
+from .pipeline import ImagePipeline, is_variant
+from dessins_d_ici.settings.caches import cache_from_url
+from .autocomplete import get_index as get_autocomplete_index
+from .exports import export_orders
+from .search import get_search_backend, tokenize
+from .stripe_stub import StubStripeServer
+from .uploads import LocalFileSystemBackend, upload_outputs
+from .webhooks import MAX_ATTEMPTS as WEBHOOK_MAX_ATTEMPTS, run_pending_events
+
+
+# silk records its own queries in dev, keep it out of query counts
+without_silk = modify_settings(MIDDLEWARE={'remove': ['silk.middleware.SilkyMiddleware']})
+
+
+def make_upload(name='dessin.png', size=(1200, 1600), color=(200, 120, 40)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def fake_upload(file, **options):
+    return {'secure_url': f"https://res.cloudinary.com/test/{options.get('folder', '')}image.png"}
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+
+@override_settings(IMAGE_UPLOAD_BACKEND='product.uploads.CloudinaryBackend')
+class ImageJobQueueTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+
+    def create_product(self):
+        return Product.objects.create(
+            category=self.category,
+            name='Chat',
+            slug='chat',
+            price='25.00',
+            image=make_upload(),
+        )
+
+    @mock.patch('product.uploads.cloudinary.uploader.upload')
+    def test_save_queues_job_without_uploading(self, upload):
+        product = self.create_product()
+
+        upload.assert_not_called()
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.PENDING)
+        self.assertTrue(product.original.name.startswith('originals/'))
+        self.assertIsNone(product.image)
+        self.assertEqual(ImageJob.objects.filter(product=product, status=ImageJob.StatusChoices.QUEUED).count(), 1)
+
+    @mock.patch('product.uploads.cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_worker_fills_image_and_thumbnail(self, upload):
+        product = self.create_product()
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        product.refresh_from_db()
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.DONE)
+        self.assertIn('watermarked/', product.image.url)
+        self.assertIn('thumbnails/', product.thumbnail.url)
+        self.assertEqual(upload.call_count, 2 + 6)
+        self.assertEqual(ImageJob.objects.get(product=product).status, ImageJob.StatusChoices.DONE)
+
+    @mock.patch('product.uploads.cloudinary.uploader.upload', side_effect=ConnectionError('cloudinary down'))
+    def test_failed_job_is_retried_with_backoff(self, upload):
+        product = self.create_product()
+
+        run_job(claim_next_job())
+
+        job = ImageJob.objects.get(product=product)
+        self.assertEqual(job.status, ImageJob.StatusChoices.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('cloudinary down', job.last_error)
+        self.assertIsNone(claim_next_job())
+
+        product.refresh_from_db()
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.PENDING)
+
+    @mock.patch('product.uploads.cloudinary.uploader.upload', side_effect=ConnectionError('cloudinary down'))
+    def test_job_fails_after_max_attempts(self, upload):
+        product = self.create_product()
+        ImageJob.objects.filter(product=product).update(attempts=MAX_ATTEMPTS - 1)
+
+        run_job(claim_next_job())
+
+        product.refresh_from_db()
+        self.assertEqual(ImageJob.objects.get(product=product).status, ImageJob.StatusChoices.FAILED)
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.FAILED)
+
+    def test_job_cannot_be_claimed_twice(self):
+        with mock.patch('product.uploads.cloudinary.uploader.upload'):
+            self.create_product()
+
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+    @mock.patch('product.uploads.cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_worker_command_drains_queue(self, upload):
+        product = self.create_product()
+
+        call_command('process_images', once=True, stdout=StringIO())
+
+        product.refresh_from_db()
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.DONE)
+
+
+class WatermarkEngineTests(TestCase):
+    def setUp(self):
+        watermark.clear_caches()
+
+    def test_matches_legacy_watermark(self):
+        img = Image.new('RGB', (600, 800), (200, 120, 40))
+
+        self.assertEqual(watermark.apply_watermark(img).tobytes(), legacy_watermark(img).tobytes())
+
+    def test_layer_is_built_once_per_resolution(self):
+        img = Image.new('RGB', (600, 800), (10, 10, 10))
+        for _ in range(3):
+            watermark.apply_watermark(img)
+        watermark.apply_watermark(Image.new('RGB', (300, 200)))
+
+        layer_info = watermark.get_layer.cache_info()
+        self.assertEqual(layer_info.misses, 2)
+        self.assertEqual(layer_info.hits, 2)
+        self.assertEqual(watermark.get_font.cache_info().misses, 1)
+
+    def test_cached_layer_is_not_modified(self):
+        layer = watermark.get_layer((600, 800)).copy()
+        watermark.apply_watermark(Image.new('RGB', (600, 800), (255, 255, 255)))
+
+        self.assertEqual(watermark.get_layer((600, 800)).tobytes(), layer.tobytes())
+
+
+class ImagePipelineTests(TestCase):
+    def test_outputs_are_encoded_once_per_format(self):
+        upload = make_upload()
+        with mock.patch('PIL.Image.Image.save', autospec=True, side_effect=Image.Image.save) as save:
+            outputs = ImagePipeline(upload).run()
+
+        self.assertEqual(save.call_count, len(outputs))
+        self.assertEqual((outputs['image'].width, outputs['image'].height), (600, 800))
+        self.assertLessEqual(outputs['thumbnail'].width, 300)
+        self.assertLessEqual(outputs['thumbnail'].height, 200)
+        for output in outputs.values():
+            self.assertEqual(Image.open(BytesIO(output.data)).format, output.format)
+
+    def test_quality_setting_is_applied(self):
+        formats = {
+            'image': {'format': 'JPEG', 'quality': 95},
+            'thumbnail': {'format': 'JPEG', 'quality': 95},
+        }
+        noisy = Image.effect_noise((1200, 1600), 64).convert('RGB')
+        upload = BytesIO()
+        noisy.save(upload, format='PNG')
+
+        high = ImagePipeline(BytesIO(upload.getvalue()), formats=formats).run()['image']
+        formats['image'] = {'format': 'JPEG', 'quality': 40}
+        low = ImagePipeline(BytesIO(upload.getvalue()), formats=formats).run()['image']
+
+        self.assertLess(len(low.data), len(high.data))
+
+    def test_variants_only_skips_the_image_and_thumbnail(self):
+        pipeline = ImagePipeline(make_upload())
+        outputs = pipeline.run(variants_only=True)
+
+        self.assertTrue(outputs)
+        self.assertTrue(all(is_variant(name) for name in outputs))
+        stages = [report.stage for report in pipeline.report]
+        self.assertEqual(stages[:3], ['decode', 'resize', 'watermark'])
+        self.assertNotIn('thumbnail', stages)
+
+    def test_report_has_time_and_bytes_per_stage(self):
+        pipeline = ImagePipeline(make_upload())
+        outputs = pipeline.run()
+
+        stages = [report.stage for report in pipeline.report]
+        self.assertEqual(stages[:6], ['decode', 'resize', 'watermark', 'encode:image', 'thumbnail', 'encode:thumbnail'])
+        self.assertIn('variant:400', stages)
+        self.assertEqual(pipeline.report[3].bytes, len(outputs['image'].data))
+        self.assertIn('encode:image', pipeline.summary())
+
+
+class UploadServiceTests(MediaRootMixin, TestCase):
+    def test_outputs_are_uploaded_concurrently(self):
+        barrier = threading.Barrier(4, timeout=5)
+
+        class BarrierBackend:
+            def upload(self, data, folder, format):
+                # Both uploads must be in flight at the same time to pass the barrier
+                barrier.wait()
+                return f"https://cdn.test/{folder}"
+
+        outputs = ImagePipeline(make_upload()).run()
+        urls = upload_outputs(outputs, backend=BarrierBackend())
+
+        self.assertEqual(urls['image'], 'https://cdn.test/watermarked/')
+        self.assertEqual(urls['thumbnail'], 'https://cdn.test/thumbnails/')
+        self.assertEqual(urls['variant_400_webp'], 'https://cdn.test/variants/')
+
+    def test_local_backend_writes_to_media_root(self):
+        outputs = ImagePipeline(make_upload()).run()
+        urls = upload_outputs(outputs, backend=LocalFileSystemBackend())
+
+        for name, folder in (('image', 'watermarked'), ('thumbnail', 'thumbnails')):
+            self.assertIn(f'/media/{folder}/', urls[name])
+            path = Path(self.media_root) / folder / urls[name].rsplit('/', 1)[1]
+            self.assertEqual(path.read_bytes(), outputs[name].data)
+
+    @override_settings(IMAGE_UPLOAD_BACKEND='product.uploads.LocalFileSystemBackend')
+    def test_worker_runs_offline_with_local_backend(self):
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        product = Product.objects.create(category=category, name='Chat', slug='chat', price='25.00', image=make_upload())
+
+        run_pending_jobs()
+
+        product.refresh_from_db()
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.DONE)
+        self.assertTrue(product.image.url.startswith('http://localhost:8000/media/watermarked/'))
+
+
+class ImportProductsCommandTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Category.objects.create(name='Animaux', slug='animaux')
+        self.images = Path(self.media_root) / 'sources'
+        self.images.mkdir()
+        for index in range(3):
+            (self.images / f'{index}.png').write_bytes(make_upload(size=(120, 160)).read())
+
+    def write_manifest(self, name, rows):
+        manifest = Path(self.media_root) / name
+        if name.endswith('.csv'):
+            with open(manifest, 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=['name', 'slug', 'category', 'price', 'image'])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            manifest.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+        return manifest
+
+    def rows(self):
+        return [
+            {'name': f'Dessin {index}', 'slug': f'dessin-{index}', 'category': 'animaux', 'price': '10.00', 'image': f'{index}.png'}
+            for index in range(3)
+        ]
+
+    def run_import(self, manifest, **options):
+        call_command('import_products', str(manifest), images=str(self.images), workers=2, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_import_csv_in_batches(self):
+        manifest = self.write_manifest('products.csv', self.rows())
+
+        with self.assertNumQueries(12):
+            self.run_import(manifest, batch_size=2)
+
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(ProductImageVariant.objects.count(), 3 * 6)
+        product = Product.objects.get(slug='dessin-0')
+        self.assertEqual(product.processing_status, Product.ProcessingStatus.DONE)
+        self.assertIn('/media/thumbnails/', product.thumbnail.url)
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_import_resumes_from_checkpoint(self):
+        manifest = self.write_manifest('products.jsonl', self.rows())
+        Path(f'{manifest}.checkpoint').write_text('animaux/dessin-0\nanimaux/dessin-1\n')
+
+        self.run_import(manifest)
+
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['dessin-2'])
+        self.run_import(manifest)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_rows_committed_before_a_crash_are_not_inserted_again(self):
+        manifest = self.write_manifest('products.jsonl', self.rows())
+        # Batch committed, checkpoint never written
+        Product.objects.create(category=Category.objects.get(), name='Dessin 0', slug='dessin-0', price='10.00')
+
+        self.run_import(manifest)
+
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['dessin-0', 'dessin-1', 'dessin-2'])
+
+    def test_invalid_rows_are_reported(self):
+        rows = self.rows()
+        rows.append(dict(rows[1]))
+        del rows[2]['image']
+        manifest = self.write_manifest('products.jsonl', rows)
+        stderr = StringIO()
+
+        call_command('import_products', str(manifest), images=str(self.images), workers=1, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['dessin-0', 'dessin-1'])
+        self.assertIn('animaux/dessin-1 ignoré: en double dans le manifeste', stderr.getvalue())
+        self.assertIn('animaux/dessin-2 ignoré: image manquante', stderr.getvalue())
+
+    def test_unknown_category_is_skipped(self):
+        rows = self.rows()
+        rows[0]['category'] = 'inconnue'
+        manifest = self.write_manifest('products.jsonl', rows)
+
+        self.run_import(manifest)
+
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class ProductImageVariantTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        catalog_cache.get_cache().clear()
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+
+    def test_pipeline_builds_variants_per_width_and_format(self):
+        outputs = ImagePipeline(make_upload()).run()
+        variants = {(output.width, output.format) for name, output in outputs.items() if name.startswith('variant_')}
+
+        self.assertEqual(variants, {(width, fmt) for width in (200, 400, 600) for fmt in ('WEBP', 'JPEG')})
+
+    def test_worker_stores_variants_and_serializer_exposes_srcset(self):
+        product = Product.objects.create(category=self.category, name='Chat', slug='chat', price='25.00', image=make_upload())
+        run_pending_jobs()
+
+        self.assertEqual(product.variants.count(), 6)
+        response = self.client.get('/api/v1/products/animaux/chat/')
+        srcset = response.json()['srcset']
+        self.assertEqual(len(srcset), 6)
+        self.assertEqual(set(srcset[0]), {'url', 'width', 'height', 'format', 'size'})
+        self.assertTrue(all(variant['size'] > 0 for variant in srcset))
+
+    @without_silk
+    def test_latest_products_prefetch_variants(self):
+        for index in range(4):
+            product = Product.objects.create(category=self.category, name=f'Dessin {index}', slug=f'dessin-{index}', price='10.00')
+            ProductImageVariant.objects.create(product=product, width=200, height=267, format='WEBP', size=100, url='https://cdn.test/a.webp')
+
+        # ETag state, products, variants
+        with self.assertNumQueries(3):
+            self.client.get('/api/v1/latest-product/')
+
+    def test_backfill_uses_local_original(self):
+        product = Product.objects.create(category=self.category, name='Chat', slug='chat', price='25.00', image=make_upload())
+        run_pending_jobs()
+        product.variants.all().delete()
+
+        call_command('generate_variants', workers=1, stdout=StringIO())
+
+        self.assertEqual(product.variants.count(), 6)
+        call_command('generate_variants', workers=1, stdout=StringIO())
+        self.assertEqual(product.variants.count(), 6)
+
+    def test_backfill_downloads_image_without_original(self):
+        product = Product.objects.create(category=self.category, name='Chat', slug='chat', price='25.00')
+        Product.objects.filter(pk=product.pk).update(image='https://res.cloudinary.com/test/watermarked/chat.png')
+        response = mock.Mock(content=make_upload(size=(600, 800)).read())
+
+        with mock.patch('requests.Session.get', return_value=response) as get:
+            call_command('generate_variants', workers=1, stdout=StringIO())
+
+        get.assert_called_once()
+        self.assertEqual(product.variants.count(), 6)
+
+
+class InMemoryRedis:
+    """
+    Local stand-in for redis.Redis with the commands used by Django's
+    RedisCache. Shared by every client, expiry is not simulated.
+    """
+    data = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @staticmethod
+    def encode(value):
+        return str(value).encode() if isinstance(value, int) else value
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self.encode(value)
+        return True
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def mset(self, mapping):
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def incr(self, key, delta=1):
+        self.data[key] = self.encode(int(self.data.get(key, 0)) + delta)
+        return int(self.data[key])
+
+    def expire(self, key, timeout):
+        return key in self.data
+
+    persist = exists
+
+    def flushdb(self):
+        self.data.clear()
+        return True
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+
+@without_silk
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        get_search_backend().reset()
+        self.animaux = Category.objects.create(name='Animaux', slug='animaux')
+        self.paysages = Category.objects.create(name='Paysages', slug='paysages')
+        self.chat = Product.objects.create(category=self.animaux, name='Chat', slug='chat', price='25.00')
+        self.mer = Product.objects.create(category=self.paysages, name='Mer', slug='mer', price='30.00')
+
+    def assertCached(self, url):
+        # At most the small ETag query on the category table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 1)
+        self.assertFalse(any('product_product' in query['sql'] for query in queries))
+        return response
+
+    def assertNotCached(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertGreater(len(queries), 0)
+        return response
+
+    def save(self, instance):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def test_second_request_is_served_from_cache(self):
+        urls = [
+            '/api/v1/latest-product/',
+            '/api/v1/products/animaux/',
+            '/api/v1/products/animaux/chat/',
+            '/api/v1/products/?search=chat',
+        ]
+        for url in urls:
+            first = self.assertNotCached(url)
+            second = self.assertCached(url)
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(second['Content-Type'], 'application/json')
+
+    def test_query_string_is_part_of_the_key(self):
+        self.client.get('/api/v1/products/?search=chat')
+
+        response = self.assertNotCached('/api/v1/products/?search=mer')
+        self.assertEqual(response.json()['results'][0]['name'], 'Mer')
+
+    def test_product_change_only_invalidates_its_scopes(self):
+        for url in ('/api/v1/products/animaux/', '/api/v1/products/paysages/', '/api/v1/products/paysages/mer/'):
+            self.client.get(url)
+
+        self.chat.price = '27.00'
+        self.save(self.chat)
+
+        self.assertEqual(self.assertNotCached('/api/v1/products/animaux/').json()['products'][0]['price'], '27.00')
+        self.assertCached('/api/v1/products/paysages/')
+        self.assertCached('/api/v1/products/paysages/mer/')
+
+    def test_moved_product_invalidates_old_url(self):
+        self.client.get('/api/v1/products/animaux/chat/')
+
+        self.chat.category = self.paysages
+        self.save(self.chat)
+
+        self.assertEqual(self.client.get('/api/v1/products/animaux/chat/').status_code, 404)
+
+    def test_category_rename_invalidates_product_pages(self):
+        self.client.get('/api/v1/products/animaux/chat/')
+
+        self.animaux.name = 'Animaux de compagnie'
+        self.save(self.animaux)
+
+        response = self.assertNotCached('/api/v1/products/animaux/chat/')
+        self.assertEqual(response.json()['category_name'], 'Animaux de compagnie')
+
+    def test_deleted_product_disappears(self):
+        self.client.get('/api/v1/latest-product/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mer.delete()
+
+        names = [product['name'] for product in self.client.get('/api/v1/latest-product/').json()]
+        self.assertEqual(names, ['Chat'])
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.get('/api/v1/latest-product/')
+        self.client.get('/api/v1/latest-product/')
+
+        self.assertEqual(self.client.get('/api/v1/internal/catalog-cache/').status_code, 401)
+
+        staff = MyUser.objects.create_user('Admin', 'Istrateur', 'admin@example.com', 'Password123!', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        stats = client.get('/api/v1/internal/catalog-cache/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_redis_backend_from_cache_url(self):
+        InMemoryRedis.data = {}
+        redis_caches = {alias: cache_from_url('redis://localhost:6379/0', alias) for alias in ('default', 'catalog')}
+
+        with mock.patch('redis.Redis', InMemoryRedis), override_settings(CACHES=redis_caches):
+            self.assertEqual(catalog_cache.stats()['backend'], 'django.core.cache.backends.redis.RedisCache')
+            self.assertNotCached('/api/v1/products/animaux/')
+            self.assertCached('/api/v1/products/animaux/')
+
+            self.chat.price = '27.00'
+            self.save(self.chat)
+            response = self.assertNotCached('/api/v1/products/animaux/')
+            self.assertEqual(response.json()['products'][0]['price'], '27.00')
+
+        # KEY_PREFIX from cache_from_url, then the version of the key
+        self.assertTrue(any(key.startswith('catalog:1:catalog:body:') for key in InMemoryRedis.data))
+
+    def test_image_status_saves_keep_the_cache(self):
+        self.client.get('/api/v1/products/animaux/')
+        version = Category.objects.get(pk=self.animaux.pk).version
+
+        self.chat.processing_status = Product.ProcessingStatus.PROCESSING
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chat.save(update_fields=['processing_status'])
+
+        self.assertEqual(Category.objects.get(pk=self.animaux.pk).version, version)
+        self.assertCached('/api/v1/products/animaux/')
+
+    def test_file_based_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+
+        with override_settings(CACHES={'default': file_cache, 'catalog': file_cache}):
+            self.assertNotCached('/api/v1/products/animaux/')
+            self.assertCached('/api/v1/products/animaux/')
+
+
+@without_silk
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.animaux = Category.objects.create(name='Animaux', slug='animaux')
+        self.paysages = Category.objects.create(name='Paysages', slug='paysages')
+        self.chat = Product.objects.create(category=self.animaux, name='Chat', slug='chat', price='25.00')
+        Product.objects.create(category=self.paysages, name='Mer', slug='mer', price='30.00')
+
+    def test_etag_and_last_modified_are_sent(self):
+        for url in ('/api/v1/latest-product/', '/api/v1/products/animaux/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertIn('GMT', response['Last-Modified'])
+
+    def test_not_modified_costs_one_aggregate_query(self):
+        for url in ('/api/v1/latest-product/', '/api/v1/products/animaux/'):
+            etag = self.client.get(url)['ETag']
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/v1/products/animaux/')['Last-Modified']
+
+        response = self.client.get('/api/v1/products/animaux/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_change_updates_only_its_category_etag(self):
+        animaux = self.client.get('/api/v1/products/animaux/')['ETag']
+        paysages = self.client.get('/api/v1/products/paysages/')['ETag']
+        latest = self.client.get('/api/v1/latest-product/')['ETag']
+
+        self.chat.price = '27.00'
+        self.chat.save()
+
+        self.assertEqual(self.client.get('/api/v1/products/animaux/', HTTP_IF_NONE_MATCH=animaux).status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/products/paysages/', HTTP_IF_NONE_MATCH=paysages).status_code, 304)
+        self.assertEqual(self.client.get('/api/v1/latest-product/', HTTP_IF_NONE_MATCH=latest).status_code, 200)
+
+    def test_category_rename_changes_etags(self):
+        urls = ('/api/v1/products/animaux/', '/api/v1/latest-product/')
+        etags = [self.client.get(url)['ETag'] for url in urls]
+
+        self.animaux.name = 'Felins'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.animaux.save()
+
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        chat = next(product for product in response.json() if product['name'] == 'Chat')
+        self.assertEqual(chat['category_name'], 'Felins')
+
+    def test_stale_category_save_keeps_the_version_moving_forward(self):
+        stale = Category.objects.get(pk=self.animaux.pk)
+        self.chat.price = '27.00'
+        self.chat.save()
+        version = Category.objects.get(pk=self.animaux.pk).version
+        etag = self.client.get('/api/v1/products/animaux/')['ETag']
+
+        stale.save()
+
+        self.assertEqual(stale.version, version + 1)
+        self.assertEqual(self.client.get('/api/v1/products/animaux/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_write_from_another_process_misses_the_cached_body(self):
+        etag = self.client.get('/api/v1/products/animaux/')['ETag']
+
+        # Like a worker whose cache is not this process's: no invalidation here
+        with mock.patch('product.signals.invalidate_on_commit'), self.captureOnCommitCallbacks(execute=True):
+            self.chat.price = '27.00'
+            self.chat.save()
+
+        response = self.client.get('/api/v1/products/animaux/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][0]['price'], '27.00')
+        self.assertEqual(self.client.get('/api/v1/products/animaux/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_deleted_product_changes_etag(self):
+        etag = self.client.get('/api/v1/products/animaux/')['ETag']
+
+        self.chat.delete()
+
+        self.assertEqual(self.client.get('/api/v1/products/animaux/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unknown_category_is_still_404(self):
+        self.assertEqual(self.client.get('/api/v1/products/inconnue/').status_code, 404)
+
+
+@without_silk
+class CategoryDetailTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+
+    def add_products(self, count):
+        start = self.category.products.count()
+        products = Product.objects.bulk_create([
+            Product(category=self.category, name=f'Dessin {index}', slug=f'dessin-{index}', price='10.00', description='Long texte')
+            for index in range(start, start + count)
+        ])
+        ProductImageVariant.objects.bulk_create([
+            ProductImageVariant(product=product, width=200, height=267, format='WEBP', size=100, url='https://cdn.test/a.webp')
+            for product in products
+        ])
+
+    def get(self, url='/api/v1/products/animaux/'):
+        catalog_cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_query_count_is_constant_as_category_grows(self):
+        self.add_products(3)
+        _, small = self.get()
+
+        self.add_products(60)
+        _, large = self.get()
+
+        # ETag state, category, products page, variants
+        self.assertEqual(small, 4)
+        self.assertEqual(large, small)
+
+    def test_products_are_paginated_without_description(self):
+        self.add_products(25)
+
+        data, _ = self.get()
+
+        self.assertEqual((data['name'], data['get_absolute_url']), ('Animaux', '/animaux/'))
+        self.assertEqual(len(data['products']), 20)
+        self.assertNotIn('description', data['products'][0])
+        self.assertEqual(data['products'][0]['category_name'], 'Animaux')
+        self.assertIsNone(data['previous'])
+
+        second, _ = self.get(data['next'])
+        self.assertEqual(len(second['products']), 5)
+        self.assertIsNone(second['next'])
+        names = {product['name'] for product in data['products'] + second['products']}
+        self.assertEqual(len(names), 25)
+
+
+@without_silk
+class SearchKeysetPaginationTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        Product.objects.bulk_create([
+            Product(category=category, name=f'Dessin {index:02}', slug=f'dessin-{index}', price=index % 4 + 1)
+            for index in range(25)
+        ])
+
+    def walk(self, url):
+        pages = []
+        while url:
+            catalog_cache.get_cache().clear()
+            data = self.client.get(url).json()
+            pages.append(data)
+            url = data['next']
+        return pages
+
+    def test_walks_every_product_once_without_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/products/?limit=10')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+        pages = self.walk('/api/v1/products/?limit=10')
+
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        ids = [product['id'] for page in pages for product in page['results']]
+        self.assertEqual(ids, list(Product.objects.order_by('-date_added', '-id').values_list('id', flat=True)))
+        self.assertNotIn('count', pages[0])
+
+    def test_price_ordering_with_ties(self):
+        pages = self.walk('/api/v1/products/?limit=7&ordering=price')
+
+        results = [product for page in pages for product in page['results']]
+        self.assertEqual(len({product['id'] for product in results}), 25)
+        prices = [float(product['price']) for product in results]
+        self.assertEqual(prices, sorted(prices))
+
+    def test_name_descending_and_previous_link(self):
+        first = self.client.get('/api/v1/products/?limit=10&ordering=-name').json()
+        self.assertEqual(first['results'][0]['name'], 'Dessin 24')
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_cursor_is_opaque_and_validated(self):
+        next_link = self.client.get('/api/v1/products/?limit=10').json()['next']
+        cursor = next_link.split('cursor=')[1]
+        self.assertNotIn('date_added', cursor)
+
+        self.assertEqual(self.client.get('/api/v1/products/?cursor=nimportequoi').status_code, 404)
+        # A cursor only works with the ordering it was made for
+        self.assertEqual(self.client.get(f'/api/v1/products/?ordering=price&cursor={cursor}').status_code, 404)
+
+        # Tampered values are rejected before the query
+        for ordering, payload in (
+            ('price', {'o': 'price', 'v': ['abc', 1], 'r': False}),
+            ('-date_added', {'o': '-date_added', 'v': ['2020-01-01', 'q'], 'r': False}),
+            ('-date_added', {'o': '-date_added', 'v': [None, 1], 'r': False}),
+            ('-date_added', {'o': '-date_added', 'v': ['2020-01-01', 1]}),
+            ('-date_added', ['v']),
+        ):
+            cursor = urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get(f'/api/v1/products/?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404, payload)
+
+        cursor = urlsafe_b64encode(json.dumps({'o': 'price', 'v': ['12.50', '3'], 'r': False}).encode()).decode()
+        self.assertEqual(self.client.get(f'/api/v1/products/?ordering=price&cursor={cursor}').status_code, 200)
+
+
+@without_silk
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        get_search_backend().reset()
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+        self.create('Chevaux au galop', 'Deux chevaux dessinés au crayon')
+        self.create('Éléphant', "Un éléphant d'Afrique à l'aquarelle")
+        self.create('Chat noir', 'Dessin de chat, les chevaux en fond')
+
+    def create(self, name, description):
+        return Product.objects.create(
+            category=self.category, name=name, slug=name.lower().replace(' ', '-'), price='10.00', description=description
+        )
+
+    def search(self, text):
+        catalog_cache.get_cache().clear()
+        return [product['name'] for product in self.client.get('/api/v1/products/', {'search': text}).json()['results']]
+
+    def test_tokenize_stems_and_unaccents(self):
+        self.assertEqual(tokenize("Les Éléphants dessinés"), ['elephant', 'dessin'])
+        self.assertEqual(tokenize('animaux dessiner'), ['animal', 'dessin'])
+
+    def test_matches_accents_plurals_and_ranks_name_first(self):
+        self.assertEqual(self.search('elephants'), ['Éléphant'])
+        self.assertEqual(self.search('cheval'), ['Chevaux au galop', 'Chat noir'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('chat chevaux'), ['Chat noir'])
+        self.assertEqual(self.search('licorne'), [])
+
+    def test_no_like_scan(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('chat')
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search('chat')
+        product = self.create('Licorne', 'Une licorne')
+
+        self.assertEqual(self.search('licorne'), ['Licorne'])
+
+        product.name = 'Dragon'
+        product.description = ''
+        product.save()
+        self.assertEqual(self.search('licorne'), [])
+        self.assertEqual(self.search('dragon'), ['Dragon'])
+
+        product.delete()
+        self.assertEqual(self.search('dragon'), [])
+
+    def test_explicit_ordering_overrides_rank(self):
+        catalog_cache.get_cache().clear()
+        results = self.client.get('/api/v1/products/', {'search': 'cheval', 'ordering': 'name'}).json()['results']
+
+        self.assertEqual([product['name'] for product in results], ['Chat noir', 'Chevaux au galop'])
+
+    def test_ranked_results_paginate(self):
+        for index in range(5):
+            self.create(f'Cheval {index}', '')
+
+        pages, url = [], '/api/v1/products/?search=cheval&limit=3'
+        while url:
+            catalog_cache.get_cache().clear()
+            data = self.client.get(url).json()
+            pages.append([product['name'] for product in data['results']])
+            url = data['next']
+
+        names = [name for page in pages for name in page]
+        self.assertEqual(len(names), 7)
+        self.assertEqual(len(set(names)), 7)
+        self.assertEqual(names[-1], 'Chat noir')
+
+    def test_fractional_ranks_paginate_one_row_at_a_time(self):
+        # Different frequencies: scores are sums of logarithms, not round numbers
+        for index in range(4):
+            self.create(f'Cheval {index}', ' '.join(['cheval'] * index))
+
+        names, url = [], '/api/v1/products/?search=cheval&limit=1'
+        for _ in range(20):
+            if not url:
+                break
+            catalog_cache.get_cache().clear()
+            data = self.client.get(url).json()
+            names += [product['name'] for product in data['results']]
+            url = data['next']
+
+        self.assertIsNone(url)
+        self.assertEqual(len(names), 6)
+        self.assertEqual(len(set(names)), 6)
+
+    def test_search_vector_is_never_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(Product.objects.all())
+        self.assertNotIn('search_vector', queries[0]['sql'])
+
+
+@without_silk
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        get_autocomplete_index().reset()
+        self.category = Category.objects.create(name='Animaux sauvages', slug='animaux')
+        self.chat = self.create('Chat noir')
+        self.create('Éléphant rose')
+        self.create('Chevaux au galop')
+
+    def create(self, name):
+        return Product.objects.create(category=self.category, name=name, slug=name.lower().replace(' ', '-'), price='10.00')
+
+    def suggest(self, q, **params):
+        return self.client.get('/api/v1/autocomplete/', {'q': q, **params}).json()
+
+    def names(self, q):
+        return [product['name'] for product in self.suggest(q)['products']]
+
+    def test_matches_name_and_word_prefixes_without_accents(self):
+        self.assertEqual(self.names('ch'), ['Chat noir', 'Chevaux au galop'])
+        self.assertEqual(self.names('ELE'), ['Éléphant rose'])
+        self.assertEqual(self.names('noi'), ['Chat noir'])
+        self.assertEqual(self.names('chat n'), ['Chat noir'])
+        self.assertEqual(self.names('chat r'), [])
+
+    def test_returns_ids_names_and_thumbnails_only(self):
+        data = self.suggest('sauv')
+
+        self.assertEqual(data['categories'], [{'id': self.category.pk, 'name': 'Animaux sauvages'}])
+        self.assertEqual(self.suggest('chat')['products'], [{'id': self.chat.pk, 'name': 'Chat noir', 'thumbnail': None}])
+
+    def test_no_query_once_built(self):
+        self.suggest('ch')
+        with self.assertNumQueries(0):
+            self.suggest('che')
+
+    def test_limit(self):
+        self.assertEqual(len(self.suggest('ch', limit=1)['products']), 1)
+        self.assertEqual(self.suggest('', limit=1), {'categories': [], 'products': []})
+
+    def test_index_follows_saves_and_deletes(self):
+        self.suggest('ch')
+
+        self.chat.name = 'Hibou'
+        self.chat.save()
+        self.assertEqual(self.names('ch'), ['Chevaux au galop'])
+        self.assertEqual(self.names('hib'), ['Hibou'])
+
+        self.chat.delete()
+        self.assertEqual(self.names('hib'), [])
+
+        self.category.name = 'Oiseaux'
+        self.category.save()
+        self.assertEqual(self.suggest('ois')['categories'], [{'id': self.category.pk, 'name': 'Oiseaux'}])
+        self.assertEqual(self.suggest('sauv')['categories'], [])
+
+    def test_rebuilds_when_another_process_changed_the_catalog(self):
+        self.suggest('ch')
+        # What the signals of another process leave in the database: nothing reaches this process's cache
+        Product.objects.filter(pk=self.chat.pk).update(name='Hibou')
+        Category.touch(self.category.pk)
+
+        index = get_autocomplete_index()
+        with mock.patch('product.autocomplete.REFRESH_INTERVAL', 0), \
+                mock.patch.object(index, 'start_rebuild') as start_rebuild:
+            # The current index keeps answering until the new one is swapped in
+            self.assertEqual(self.names('hib'), [])
+            self.assertEqual(self.names('hib'), [])
+            start_rebuild.assert_called_once()
+
+            self.create('Hirondelle')
+            index.rebuild()
+            self.assertEqual(self.names('hi'), ['Hibou', 'Hirondelle'])
+
+    def test_own_writes_do_not_rebuild(self):
+        self.suggest('ch')
+        self.chat.name = 'Hibou'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chat.save()
+
+        index = get_autocomplete_index()
+        with mock.patch('product.autocomplete.REFRESH_INTERVAL', 0), \
+                mock.patch.object(index, 'start_rebuild') as start_rebuild:
+            # Only the catalog version is read
+            with self.assertNumQueries(1):
+                self.assertEqual(self.names('hib'), ['Hibou'])
+            start_rebuild.assert_not_called()
+
+            self.category.name = 'Oiseaux'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.category.save()
+            self.assertEqual(self.suggest('ois')['categories'], [{'id': self.category.pk, 'name': 'Oiseaux'}])
+            start_rebuild.assert_not_called()
+
+
+def full_scans(sql):
+    """
+    Steps of the query plan of `sql` that read a whole table.
+    Sequential scans are disabled on PostgreSQL so that small test
+    tables do not hide a missing index.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall() if re.match(r'SCAN (TABLE )?\w+$', row[-1])]
+
+
+@without_silk
+class QueryPlanTests(TestCase):
+    """
+    Every query run by the hot endpoints must go through an index
+    """
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        django_cache.clear()
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+        for index in range(3):
+            other = Category.objects.create(name=f'Autre {index}', slug=f'autre-{index}')
+            Product.objects.create(category=other, name='Chat', slug='chat', price='10.00')
+        self.product = Product.objects.create(category=self.category, name='Chat', slug='chat', price='25.00')
+
+    def assertIndexedQueries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertEqual(full_scans(sql), [], sql)
+
+    def test_product_detail(self):
+        self.assertIndexedQueries(lambda: self.client.get('/api/v1/products/animaux/chat/'))
+
+    def test_category_detail(self):
+        self.assertIndexedQueries(lambda: self.client.get('/api/v1/products/animaux/'))
+
+    def test_order_create_and_pending_lookup(self):
+        items = {'items': [{'product': self.product.pk, 'quantity': 1}]}
+        self.assertIndexedQueries(lambda: self.api.post('/api/v1/orders/', items, format='json'))
+        # Cache miss: the lookup reads the database
+        django_cache.clear()
+        self.assertIndexedQueries(lambda: self.api.get('/api/v1/orders/check_pending_order/'))
+
+    def test_order_list(self):
+        Order.objects.create(user=self.user)
+        self.assertIndexedQueries(lambda: self.api.get('/api/v1/orders/'))
+
+
+class ConstraintTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.category = Category.objects.create(name='Animaux', slug='animaux')
+
+    def test_one_pending_order_per_user(self):
+        Order.objects.create(user=self.user, status=Order.StatusChoices.CONFIRMED)
+        Order.objects.create(user=self.user, status=Order.StatusChoices.CONFIRMED)
+        Order.objects.create(user=self.user)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(user=self.user)
+
+    def test_unique_slugs(self):
+        Product.objects.create(category=self.category, name='Chat', slug='chat', price='10.00')
+        other = Category.objects.create(name='Autre', slug='autre')
+        Product.objects.create(category=other, name='Chat', slug='chat', price='10.00')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(category=self.category, name='Chat 2', slug='chat', price='10.00')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.create(name='Animaux 2', slug='animaux')
+
+
+@without_silk
+class OrderWriteTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        self.products = [
+            Product.objects.create(category=category, name=f'Dessin {index}', slug=f'dessin-{index}', price='10.00')
+            for index in range(10)
+        ]
+
+    def items(self, *quantities):
+        return [{'product': product.pk, 'quantity': quantity} for product, quantity in zip(self.products, quantities) if quantity]
+
+    def create(self, items):
+        return self.api.post('/api/v1/orders/', {'items': items}, format='json')
+
+    def lines(self, order_id):
+        return dict(OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'))
+
+    def test_create_writes_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            response = self.create(self.items(1, 2))
+        self.assertEqual(response.status_code, 201)
+        Order.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.create(self.items(*range(1, 11)))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.lines(response.json()['order_id'])), 10)
+
+        writes = lambda queries: [query for query in queries if not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes(large)), len(writes(small)))
+        self.assertEqual(sum('"product_product"."id" IN (' in query['sql'] for query in large), 1)
+
+    def test_unknown_product_writes_nothing(self):
+        items = self.items(1) + [{'product': 999999, 'quantity': 1}]
+        response = self.create(items)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'][0], {})
+        self.assertIn('999999', response.json()['items'][1]['product'][0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_same_product_lines_are_merged(self):
+        response = self.create(self.items(2) + self.items(3))
+
+        self.assertEqual(self.lines(response.json()['order_id']), {self.products[0].pk: 5})
+
+    def test_update_only_writes_changed_lines(self):
+        order_id = self.create(self.items(1, 1, 1)).json()['order_id']
+        unchanged = OrderItem.objects.get(order_id=order_id, product=self.products[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.patch(f'/api/v1/orders/{order_id}/', {'items': self.items(1, 5, 0, 2)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(order_id), {self.products[0].pk: 1, self.products[1].pk: 5, self.products[3].pk: 2})
+        self.assertTrue(OrderItem.objects.filter(pk=unchanged.pk).exists())
+        writes = [query['sql'].split()[0] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        # bulk_update of the quantities, totals, then the order itself
+        self.assertEqual(sorted(writes), ['DELETE', 'INSERT', 'UPDATE', 'UPDATE', 'UPDATE'])
+
+    def test_update_without_items_keeps_them(self):
+        order_id = self.create(self.items(1, 1)).json()['order_id']
+
+        self.api.patch(f'/api/v1/orders/{order_id}/', {}, format='json')
+
+        self.assertEqual(len(self.lines(order_id)), 2)
+
+
+@without_silk
+class PendingOrderTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        self.product = Product.objects.create(category=category, name='Chat', slug='chat', price='10.00')
+
+    def create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.api.post('/api/v1/orders/', {'items': [{'product': self.product.pk, 'quantity': 1}]}, format='json')
+
+    def check(self):
+        return self.api.get('/api/v1/orders/check_pending_order/').json()['order_id']
+
+    def test_check_confirms_the_cached_order(self):
+        order_id = self.create().json()['order_id']
+
+        # One primary key lookup instead of the (user, status) search
+        with self.assertNumQueries(1):
+            self.assertEqual(self.check(), order_id)
+
+    def test_order_confirmed_by_another_process_is_not_reported(self):
+        order_id = self.create().json()['order_id']
+        # Like the webhook worker: its cache is not the one of the web processes
+        with mock.patch('product.orders.cache'):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.get(pk=order_id)
+                order.status = Order.StatusChoices.CONFIRMED
+                order.save(update_fields=['status'])
+
+        self.assertIsNone(self.check())
+        self.assertNotEqual(self.create().json()['order_id'], order_id)
+
+    def test_no_pending_order_is_not_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.check())
+
+        # Created by another process: no signal reaches this process's cache
+        order, = Order.objects.bulk_create([Order(user=self.user)])
+
+        self.assertEqual(self.check(), str(order.pk))
+
+    def test_second_create_returns_the_pending_order(self):
+        first = self.create().json()['order_id']
+
+        self.assertEqual(self.create().json()['order_id'], first)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_losing_a_concurrent_create_returns_the_winner(self):
+        # Both requests saw no pending order, the other one inserted first
+        winner = Order.objects.create(user=self.user)
+        with mock.patch('product.serializers.pending_order', return_value=None):
+            response = self.create()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['order_id'], str(winner.pk))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_confirmed_order_frees_the_pending_slot(self):
+        order = Order.objects.get(pk=self.create().json()['order_id'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = Order.StatusChoices.CONFIRMED
+            order.save(update_fields=['status'])
+
+        self.assertIsNone(self.check())
+        self.assertNotEqual(self.create().json()['order_id'], str(order.pk))
+        self.assertEqual(Order.objects.count(), 2)
+
+
+@without_silk
+class OrderTotalsTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        self.chat = Product.objects.create(category=category, name='Chat', slug='chat', price='12.50')
+        self.chien = Product.objects.create(category=category, name='Chien', slug='chien', price='20.00')
+
+    def test_totals_follow_item_changes(self):
+        response = self.api.post('/api/v1/orders/', {'items': [
+            {'product': self.chat.pk, 'quantity': 2},
+            {'product': self.chien.pk, 'quantity': 1},
+        ]}, format='json')
+        order = Order.objects.get()
+        self.assertEqual((order.total_price, order.item_count), (Decimal('45.00'), 3))
+        self.assertEqual((response.json()['total_price'], response.json()['item_count']), (45.0, 3))
+
+        response = self.api.patch(f'/api/v1/orders/{order.pk}/', {'items': [{'product': self.chien.pk, 'quantity': 2}]}, format='json')
+        order.refresh_from_db()
+        self.assertEqual((order.total_price, order.item_count), (Decimal('40.00'), 2))
+        self.assertEqual(response.json()['total_price'], 40.0)
+
+    def test_create_payment_reads_the_stored_total(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.chat, quantity=2)
+        order.update_totals()
+
+        with StubStripeServer() as stripe_server, CaptureQueriesContext(connection) as queries:
+            response = self.api.post(f'/api/v1/orders/{order.pk}/create_payment/', {'name': 'Jean'})
+
+        self.assertEqual(response.json(), {'client_secret': 'pi_stub_1_secret_stub'})
+        self.assertEqual(stripe_server.intents['pi_stub_1']['amount'], 2500)
+        self.assertFalse(any('product_orderitem' in query['sql'] for query in queries))
+
+    def test_staff_order_list_runs_constant_queries(self):
+        staff = MyUser.objects.create_user('Admin', 'Istrateur', 'admin@example.com', 'Password123!', is_staff=True)
+        self.api.force_authenticate(staff)
+
+        def add_orders(count):
+            for _ in range(count):
+                user = MyUser.objects.create_user('Client', 'Nom', f'client{MyUser.objects.count()}@example.com', 'Password123!')
+                order = Order.objects.create(user=user)
+                OrderItem.objects.create(order=order, product=self.chat, quantity=1)
+                OrderItem.objects.create(order=order, product=self.chien, quantity=1)
+                order.update_totals()
+
+        add_orders(1)
+        with CaptureQueriesContext(connection) as few:
+            self.api.get('/api/v1/orders/')
+        add_orders(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.api.get('/api/v1/orders/')
+
+        self.assertEqual(len(response.json()['results']), 11)
+        self.assertEqual(len(many), len(few))
+
+    def test_price_changes_do_not_alter_existing_orders(self):
+        response = self.api.post('/api/v1/orders/', {'items': [{'product': self.chat.pk, 'quantity': 2}]}, format='json')
+        self.chat.name = 'Chat tigré'
+        self.chat.price = '99.00'
+        self.chat.save()
+
+        order = self.api.get(f"/api/v1/orders/{response.json()['order_id']}/").json()
+
+        self.assertEqual(order['items'][0]['product_name'], 'Chat')
+        self.assertEqual(order['items'][0]['product_price'], '12.50')
+        self.assertEqual(order['items'][0]['item_subtotal'], 25.0)
+        self.assertEqual(order['total_price'], 25.0)
+
+    def test_order_reads_do_not_join_products(self):
+        self.api.post('/api/v1/orders/', {'items': [{'product': self.chat.pk, 'quantity': 1}]}, format='json')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get('/api/v1/orders/')
+
+        self.assertFalse(any('product_product' in query['sql'] for query in queries))
+
+
+@without_silk
+class StaffOrderListTests(TestCase):
+    def setUp(self):
+        self.staff = MyUser.objects.create_user('Admin', 'Istrateur', 'admin@example.com', 'Password123!', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        product = Product.objects.create(category=category, name='Chat', slug='chat', price='10.00')
+        self.orders = []
+        for index in range(5):
+            user = MyUser.objects.create_user('Client', 'Nom', f'client{index}@example.com', 'Password123!')
+            order = Order.objects.create(user=user, status=Order.StatusChoices.CONFIRMED if index % 2 else Order.StatusChoices.PENDING)
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(timezone.datetime(2026, 1, index + 1)))
+            self.orders.append(order)
+
+    def ids(self, response):
+        return [order['order_id'] for order in response.json()['results']]
+
+    def test_cursor_pages_newest_first(self):
+        response = self.api.get('/api/v1/orders/', {'page_size': 2})
+        pages = [self.ids(response)]
+        while response.json()['next']:
+            response = self.api.get(response.json()['next'])
+            pages.append(self.ids(response))
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), [str(order.pk) for order in reversed(self.orders)])
+
+    def test_date_range_and_status_filters(self):
+        response = self.api.get('/api/v1/orders/', {'created_after': '2026-01-02', 'created_before': '2026-01-05'})
+        self.assertEqual(self.ids(response), [str(order.pk) for order in reversed(self.orders[1:4])])
+
+        response = self.api.get('/api/v1/orders/', {'status': Order.StatusChoices.CONFIRMED})
+        self.assertEqual(self.ids(response), [str(self.orders[3].pk), str(self.orders[1].pk)])
+
+    def test_sparse_fields_skip_items(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/v1/orders/', {'fields': 'order_id,status,total_price'})
+
+        self.assertEqual(set(response.json()['results'][0]), {'order_id', 'status', 'total_price'})
+        self.assertFalse(any('product_orderitem' in query['sql'] for query in queries))
+
+    def test_customers_keep_a_plain_list(self):
+        self.api.force_authenticate(self.orders[0].user)
+
+        response = self.api.get('/api/v1/orders/')
+
+        self.assertEqual([order['order_id'] for order in response.json()], [str(self.orders[0].pk)])
+
+
+@without_silk
+class OrderExportTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = MyUser.objects.create_user('Admin', 'Istrateur', 'admin@example.com', 'Password123!', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        self.product = Product.objects.create(category=category, name='Chat', slug='chat', price='12.50')
+        self.january = self.create_order('2026-01-15', quantity=2)
+        self.february = self.create_order('2026-02-15', quantity=1)
+
+    def create_order(self, day, quantity):
+        order = Order.objects.create(
+            user=self.user,
+            status=Order.StatusChoices.CONFIRMED,
+            shipping_details={'name': 'Jean Dupont', 'phone': '0600000000', 'address': {
+                'line1': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris', 'country': 'FR',
+            }},
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity)
+        order.update_totals()
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(timezone.datetime.fromisoformat(day)))
+        return order
+
+    def export(self, **params):
+        response = self.api.get('/api/v1/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_one_line_per_item_with_shipping_and_totals(self):
+        response, content = self.export()
+
+        self.assertIn('attachment; filename="commandes-', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['order_id'] for row in rows], [str(self.january.pk), str(self.february.pk)])
+        self.assertEqual(rows[0]['shipping_city'], 'Paris')
+        self.assertEqual((rows[0]['total_price'], rows[0]['quantity'], rows[0]['subtotal']), ('25.00', '2', '25.00'))
+
+    def test_jsonl_gzip_and_date_range(self):
+        response, content = self.export(output='jsonl', gzip='1', created_after='2026-02-01')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        orders = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+        self.assertEqual([order['order_id'] for order in orders], [str(self.february.pk)])
+        self.assertEqual(orders[0]['items'], [{'product_name': 'Chat', 'unit_price': '12.50', 'quantity': 1, 'subtotal': '12.50'}])
+
+    def test_staff_only(self):
+        self.api.force_authenticate(self.user)
+
+        self.assertEqual(self.api.get('/api/v1/orders/export/').status_code, 403)
+
+    def test_command_writes_gzipped_file(self):
+        path = Path(self.media_root) / 'export.csv.gz'
+
+        call_command('export_orders', '--gzip', '--created-before', '2026-02-01', '--output', str(path))
+
+        rows = list(csv.DictReader(StringIO(gzip.decompress(path.read_bytes()).decode())))
+        self.assertEqual([row['order_id'] for row in rows], [str(self.january.pk)])
+
+    def test_memory_stays_flat_on_200k_orders(self):
+        # Raw inserts: building 400k model instances would dominate the test
+        ids = [uuid.uuid4().hex for _ in range(200000)]
+        created_at = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO product_order (order_id, user_id, created_at, status, total_price, item_count) VALUES (%s, %s, %s, %s, %s, %s)',
+                [(order_id, self.user.pk, created_at, Order.StatusChoices.CONFIRMED, '12.50', 1) for order_id in ids],
+            )
+            cursor.executemany(
+                'INSERT INTO product_orderitem (order_id, product_id, quantity, product_name, unit_price) VALUES (%s, %s, %s, %s, %s)',
+                [(order_id, self.product.pk, 1, 'Chat', '12.50') for order_id in ids],
+            )
+        del ids
+
+        tracemalloc.start()
+        try:
+            lines = sum(chunk.count(b'\n') for chunk in export_orders(file_format='csv'))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, 200000 + 3)
+        # One chunk of rows plus one encoded block, whatever the number of orders
+        self.assertLess(peak, 10 * 1024 * 1024)
+
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def stripe_signature(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+@without_silk
+@override_settings(STRIPE_WEBHOOK_SK=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.order = Order.objects.create(user=self.user)
+
+    def event(self, event_id, event_type, **data):
+        data.setdefault('metadata', {'order_id': str(self.order.pk)})
+        return {'id': event_id, 'object': 'event', 'type': event_type, 'data': {'object': data}}
+
+    def send(self, event, signature=None):
+        payload = json.dumps(event)
+        return self.client.post(
+            '/api/v1/webhook/stripe/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature or stripe_signature(payload),
+        )
+
+    def test_fast_path_only_stores_the_event(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(self.event('evt_1', 'payment_intent.succeeded', id='pi_1'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.StatusChoices.QUEUED)
+        self.assertFalse(any('product_order' in query['sql'] for query in queries))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.StatusChoices.PENDING)
+
+    def test_retries_are_stored_once(self):
+        event = self.event('evt_1', 'payment_intent.succeeded', id='pi_1')
+        self.send(event)
+        self.send(event)
+
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(run_pending_events(), 1)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.send(self.event('evt_1', 'payment_intent.succeeded', id='pi_1'), signature='t=1,v1=bad')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_worker_confirms_then_refund_cancels(self):
+        self.send(self.event('evt_1', 'payment_intent.succeeded', id='pi_1'))
+        run_pending_events()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_token), (Order.StatusChoices.CONFIRMED, 'pi_1'))
+
+        self.send(self.event('evt_2', 'charge.refunded', id='ch_1'))
+        # A late duplicate of the payment must not confirm the refunded order again
+        self.send(self.event('evt_3', 'payment_intent.succeeded', id='pi_1'))
+        self.assertEqual(run_pending_events(), 2)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.StatusChoices.CANCELLED)
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {WebhookEvent.StatusChoices.DONE})
+
+    def test_unknown_order_is_retried_then_failed(self):
+        self.send(self.event('evt_1', 'payment_intent.succeeded', id='pi_1', metadata={'order_id': str(uuid.uuid4())}))
+
+        run_pending_events()
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.StatusChoices.QUEUED, 1))
+        self.assertIn('DoesNotExist', event.last_error)
+
+        for _ in range(WEBHOOK_MAX_ATTEMPTS - 1):
+            WebhookEvent.objects.update(run_after=timezone.now())
+            run_pending_events()
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.StatusChoices.FAILED)
+
+    def test_replay_fetches_missed_events_and_retries_failed_ones(self):
+        WebhookEvent.objects.create(
+            event_id='evt_old', type='charge.refunded', payload=self.event('evt_old', 'charge.refunded', id='ch_1'),
+            status=WebhookEvent.StatusChoices.FAILED, attempts=WEBHOOK_MAX_ATTEMPTS,
+        )
+        missed = mock.MagicMock()
+        missed.auto_paging_iter.return_value = [
+            stripe.util.convert_to_stripe_object(self.event('evt_missed', 'payment_intent.succeeded', id='pi_1'))
+        ]
+
+        with mock.patch('product.management.commands.replay_webhooks.stripe.Event.list', return_value=missed) as event_list:
+            call_command('replay_webhooks', '--since', '2026-10-01T00:00:00+00:00', '--failed', stdout=StringIO())
+
+        self.assertIn('payment_intent.succeeded', event_list.call_args.kwargs['types'])
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.StatusChoices.DONE).count(), 2)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.StatusChoices.CANCELLED)
+
+    def test_replay_since_a_plain_date(self):
+        with mock.patch('product.management.commands.replay_webhooks.stripe.Event.list') as event_list:
+            call_command('replay_webhooks', '--since', '2026-01-01', '--no-run', stdout=StringIO())
+            with self.assertRaises(CommandError):
+                call_command('replay_webhooks', '--since', '2026-13-01', '--no-run', stdout=StringIO())
+
+        # Midnight in TIME_ZONE (Europe/Paris, UTC+1 in winter)
+        self.assertEqual(event_list.call_args.kwargs['created'], {'gte': 1767222000})
+
+
+@without_silk
+class PaymentIntentReuseTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = MyUser.objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        category = Category.objects.create(name='Animaux', slug='animaux')
+        self.chat = Product.objects.create(category=category, name='Chat', slug='chat', price='12.50')
+        self.chien = Product.objects.create(category=category, name='Chien', slug='chien', price='20.00')
+        self.order_id = self.api.post('/api/v1/orders/', {'items': [{'product': self.chat.pk, 'quantity': 1}]}, format='json').json()['order_id']
+        self.shipping = {'name': 'Jean Dupont', 'address': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris', 'country': 'FR'}
+
+    def pay(self, **shipping):
+        response = self.api.post(f'/api/v1/orders/{self.order_id}/create_payment/', {**self.shipping, **shipping})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['client_secret']
+
+    def test_reloads_reuse_the_intent(self):
+        with StubStripeServer() as stripe_server:
+            secrets = {self.pay() for _ in range(5)}
+
+            self.assertEqual(secrets, {'pi_stub_1_secret_stub'})
+            self.assertEqual(stripe_server.calls, [('POST', '/v1/payment_intents')])
+            order = Order.objects.get(pk=self.order_id)
+            self.assertEqual((order.payment_intent_id, order.payment_intent_amount), ('pi_stub_1', 1250))
+
+            django_cache.clear()
+            self.pay()
+            self.assertEqual(stripe_server.calls[-1], ('GET', '/v1/payment_intents/pi_stub_1'))
+
+    def test_total_or_shipping_change_updates_the_intent(self):
+        with StubStripeServer() as stripe_server:
+            self.pay()
+            self.api.patch(f'/api/v1/orders/{self.order_id}/', {'items': [
+                {'product': self.chat.pk, 'quantity': 1}, {'product': self.chien.pk, 'quantity': 1},
+            ]}, format='json')
+
+            self.assertEqual(self.pay(), 'pi_stub_1_secret_stub')
+            self.assertEqual(stripe_server.calls[-1], ('POST', '/v1/payment_intents/pi_stub_1'))
+            self.assertEqual(stripe_server.intents['pi_stub_1']['amount'], 3250)
+            self.assertEqual(Order.objects.get(pk=self.order_id).payment_intent_amount, 3250)
+
+            self.pay(city='Lyon')
+            self.assertEqual(len(stripe_server.calls), 3)
+            self.assertEqual(len(stripe_server.intents), 1)
+
+    def test_canceled_intent_is_replaced_when_the_total_changes(self):
+        with StubStripeServer() as stripe_server:
+            self.pay()
+            stripe_server.intents['pi_stub_1']['status'] = 'canceled'
+            self.api.patch(f'/api/v1/orders/{self.order_id}/', {'items': [{'product': self.chien.pk, 'quantity': 1}]}, format='json')
+
+            self.assertEqual(self.pay(), 'pi_stub_2_secret_stub')
+            order = Order.objects.get(pk=self.order_id)
+            self.assertEqual((order.payment_intent_id, order.payment_intent_amount), ('pi_stub_2', 2000))
+            self.assertEqual(self.pay(), 'pi_stub_2_secret_stub')
+
+    def test_concurrent_first_calls_create_one_intent(self):
+        order = Order.objects.get(pk=self.order_id)
+        with StubStripeServer() as stripe_server:
+            # Both requests read the order before either saved its intent
+            secrets = {payment_client_secret(Order.objects.get(pk=order.pk), {}) for _ in range(2)}
+
+        self.assertEqual(secrets, {'pi_stub_1_secret_stub'})
+        self.assertEqual(len(stripe_server.intents), 1)
+
+    def test_stripe_calls_share_pooled_connections(self):
+        with StubStripeServer() as stripe_server:
+            for _ in range(5):
+                django_cache.clear()
+                self.pay()
+
+        self.assertEqual(len(stripe_server.calls), 5)
+        self.assertEqual(stripe_server.connections, 1)
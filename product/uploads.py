@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import threading
+import uuid
+
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+from .pipeline import EXTENSIONS, is_variant
+
+UPLOAD_WORKERS = getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4)
+
+FOLDERS = {
+    'image': 'watermarked/',
+    'thumbnail': 'thumbnails/',
+}
+VARIANTS_FOLDER = 'variants/'
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    One thread pool shared by every upload of the process
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+        return _executor
+
+
+class CloudinaryBackend:
+    pool_configured = False
+
+    def __init__(self):
+        with _lock:
+            if not CloudinaryBackend.pool_configured:
+                self.configure_pool()
+                CloudinaryBackend.pool_configured = True
+
+    def configure_pool(self):
+        """
+        The SDK keeps a module level PoolManager holding a single keep-alive
+        connection per host: size it for the upload threads so concurrent
+        uploads reuse connections instead of opening and dropping new ones.
+        """
+        options = dict(cloudinary.CERT_KWARGS, maxsize=UPLOAD_WORKERS, block=True)
+        cloudinary.uploader._http = cloudinary.utils.get_http_connector(cloudinary.config(), options)
+
+    def upload(self, data, folder, format):
+        result = cloudinary.uploader.upload(BytesIO(data), folder=folder)
+        return result['secure_url']
+
+
+class LocalFileSystemBackend:
+    """
+    Write the assets under MEDIA_ROOT, to run the pipeline offline or load test it
+    """
+
+    def __init__(self):
+        self.storage = FileSystemStorage()
+        self.base_url = getattr(settings, 'IMAGE_UPLOAD_LOCAL_BASE_URL', 'http://localhost:8000')
+
+    def upload(self, data, folder, format):
+        name = self.storage.save(f"{folder}{uuid.uuid4().hex}.{EXTENSIONS.get(format, 'bin')}", ContentFile(data))
+        return f"{self.base_url}{self.storage.url(name)}"
+
+
+def folder_for(name):
+    return VARIANTS_FOLDER if is_variant(name) else FOLDERS[name]
+
+
+def get_backend():
+    backend = getattr(settings, 'IMAGE_UPLOAD_BACKEND', 'product.uploads.CloudinaryBackend')
+    return import_string(backend)()
+
+
+def upload_many(outputs_list, backend=None):
+    """
+    Upload the outputs of several images at once on the shared thread pool,
+    return one {name: url} dict per image, in order.
+    Raise the first upload error so the caller can retry.
+    """
+    backend = backend or get_backend()
+    executor = get_executor()
+    futures = [
+        {
+            name: executor.submit(backend.upload, output.data, folder_for(name), output.format)
+            for name, output in outputs.items()
+        }
+        for outputs in outputs_list
+    ]
+    return [{name: future.result() for name, future in image_futures.items()} for image_futures in futures]
+
+
+def upload_outputs(outputs, backend=None):
+    """
+    Upload every output of one image concurrently, return {name: url}
+    """
+    return upload_many([outputs], backend)[0]
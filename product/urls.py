@@ -10,6 +10,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('webhook/stripe/', views.stripe_webhook),
     path('latest-product/', views.LatestProductList.as_view()),
+    path('internal/catalog-cache/', views.CatalogCacheStats.as_view()),
+    path('autocomplete/', views.Autocomplete.as_view()),
     path('products/', views.SearchProduct.as_view()),
     path('products/<slug:category_slug>/<slug:product_slug>/', views.ProductDetail.as_view()),
     path('products/<slug:category_slug>/', views.CategoryDetail.as_view()),
@@ -1,34 +1,50 @@
+import json
+
 import stripe
 from decouple import config
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
-from rest_framework import generics, filters
+from rest_framework import generics
 from rest_framework.decorators import action
-from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from .serializers import ProductSerializer, CategorySerializer, OrderSerializer
+from .serializers import ProductSerializer, ProductListSerializer, CategorySerializer, OrderSerializer
 from .models import Product, Category, Order
-from .filters import OrderFilter
+from .filters import OrderFilter, FullTextSearchFilter
+from .pagination import CategoryProductsPagination, KeysetPagination, StaffOrderPagination
+from . import cache
+from .autocomplete import MAX_SUGGESTIONS, get_index
+from .exports import FORMATS, export_orders
+from .orders import pending_order_id
+from .payments import payment_client_secret
+from .webhooks import store_event
+from .cache import cache_catalog_response
+from .conditional import conditional_catalog_response, category_state, latest_products_state
 
 
 class LatestProductList(APIView):
+    @conditional_catalog_response(latest_products_state)
+    @cache_catalog_response('latest')
     def get(self, request, format=None):
-        products = Product.objects.order_by('-date_added')[0:4]
+        products = Product.objects.select_related('category').prefetch_related('variants').order_by('-date_added')[0:4]
         serializer = ProductSerializer(products, many=True)
         return Response(serializer.data)
 
 class ProductDetail(APIView):
+    @cache_catalog_response('category-info:{category_slug}', 'product:{category_slug}/{product_slug}')
     def get(self, request, category_slug, product_slug, format=None):
         product = get_object_or_404(
-            Product.objects.select_related('category'),
+            Product.objects.select_related('category').prefetch_related('variants'),
             category__slug=category_slug,
             slug=product_slug
         )
@@ -36,39 +52,102 @@ class ProductDetail(APIView):
         return Response(serializer.data)
     
 class CategoryDetail(APIView):
+    @conditional_catalog_response(category_state)
+    @cache_catalog_response('category:{category_slug}')
     def get(self, request, category_slug, format=None):
-        category = get_object_or_404(
-            Category.objects.prefetch_related('products'),
-            slug=category_slug
-        )
-        serializer = CategorySerializer(category)
-        return Response(serializer.data)
+        category = get_object_or_404(Category, slug=category_slug)
+
+        # The related manager sets product.category, no query per product
+        products = category.products.defer('description').prefetch_related('variants')
+        paginator = CategoryProductsPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+
+        return Response({
+            **CategorySerializer(category).data,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'products': ProductListSerializer(page, many=True).data,
+        })
     
 class SearchProduct(generics.ListAPIView):
-    queryset = Product.objects.select_related('category').all().order_by('-date_added')
+    queryset = Product.objects.select_related('category').prefetch_related('variants').order_by('-date_added')
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
-        filters.OrderingFilter,
+        FullTextSearchFilter,
     ]
-    search_fields = ['name', 'description']
+    # Applied by the keyset pagination, with id as tie breaker.
+    # Searches are ordered by relevance unless an ordering is given.
     ordering_fields = ['name', 'price']
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
+
+    @cache_catalog_response('search')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+class Autocomplete(APIView):
+    """
+    Typeahead suggestions served from the in-memory prefix index,
+    without touching the database: ids, names and thumbnails only
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, format=None):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', MAX_SUGGESTIONS)), MAX_SUGGESTIONS))
+        except ValueError:
+            limit = MAX_SUGGESTIONS
+        return Response(get_index().suggest(request.query_params.get('q', ''), limit))
+
+class CatalogCacheStats(APIView):
+    """Hit/miss counters of the catalog cache, for staff only"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(cache.stats())
 
 stripe.api_key = config('STRIPE_SECRET_KEY')
 
 class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.prefetch_related('items__product')
+    queryset = Order.objects.prefetch_related('items')
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = None
+    pagination_class = StaffOrderPagination
     filterset_class = OrderFilter
     filter_backends = [DjangoFilterBackend]
 
+    @property
+    def paginator(self):
+        """
+        Staff see every order, page by page. A customer's own orders stay a plain list.
+        """
+        if not self.request.user.is_staff:
+            return None
+        return super().paginator
+
+    def get_sparse_fields(self):
+        """
+        ?fields=order_id,status,total_price lists only those fields
+        """
+        fields = self.request.query_params.get('fields')
+        if self.action != 'list' or not fields:
+            return None
+        return {field.strip() for field in fields.split(',')}
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         qs = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if self.action == 'create_payment' or (fields is not None and 'items' not in fields):
+            # The stored totals are enough, no need for the lines
+            qs = qs.prefetch_related(None)
         if not self.request.user.is_staff:
             qs = qs.filter(user=self.request.user)
         return qs
@@ -90,39 +169,49 @@ class OrderViewSet(ModelViewSet):
                 'country': data.get('country')
             }
         }
-        order.shipping_details = shipping_info
-        order.save()
-
-        serializer = self.get_serializer(order)
-        total_price = serializer.data['total_price']
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(total_price * 100),
-                currency='eur',
-                metadata={'order_id': str(order.order_id)},
-                shipping=shipping_info,
-                automatic_payment_methods={
-                    'enabled': True,
-                },
-            )
-            return Response({'client_secret': intent['client_secret']}, status=200)
-        except Exception as e:
-            return Response({'error': e}, status=400)
+            client_secret = payment_client_secret(order, shipping_info)
+        except stripe.error.StripeError as e:
+            return Response({'error': str(e)}, status=400)
+
+        order.shipping_details = shipping_info
+        order.save(update_fields=['shipping_details', 'payment_intent_id', 'payment_intent_amount'])
+        return Response({'client_secret': client_secret}, status=200)
     
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Accounting export streamed from a server-side cursor, e.g.
+        ?output=csv|jsonl&gzip=1&created_after=2026-01-01&created_before=2026-02-01
+        """
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in FORMATS:
+            raise ValidationError({'output': f"Format inconnu, choisir parmi {', '.join(FORMATS)}"})
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+
+        orders = self.filter_queryset(self.get_queryset())
+        filename = f"commandes-{timezone.now():%Y%m%d-%H%M%S}.{file_format}" + ('.gz' if gzip else '')
+        response = StreamingHttpResponse(
+            export_orders(orders, file_format, gzip),
+            content_type='application/gzip' if gzip else ('text/csv' if file_format == 'csv' else 'application/x-ndjson'),
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     @action(detail=False, methods=['GET'])
     def check_pending_order(self, request):
         """Check if the user already has an order but has not paid yet"""
-        pending_order = Order.objects.filter(user=request.user, status=Order.StatusChoices.PENDING).first()
-        if not pending_order:
-            return Response({'order_id': None})
-        return Response({'order_id': pending_order.order_id})
+        return Response({'order_id': pending_order_id(request.user)})
     
 @csrf_exempt
 def stripe_webhook(request):
+    """
+    Verify the signature, store the event and answer right away:
+    the order changes are applied by the webhook worker (process_webhooks)
+    """
     payload = request.body
-    sig_header = request.META['HTTP_STRIPE_SIGNATURE']
-    endpoint = config('STRIPE_WEBHOOK_SK')
-    event = None
+    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
+    endpoint = settings.STRIPE_WEBHOOK_SK
 
     try:
         event = stripe.Webhook.construct_event(
@@ -135,40 +224,5 @@ def stripe_webhook(request):
         print(f'Erreur lors de la vérification de la signture webhook: {e}')
         return HttpResponse(status=400)
 
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event.data.object
-        metadata = payment_intent.get('metadata', {})
-        order_id = metadata['order_id']
-        if order_id:
-            try:
-                order = Order.objects.get(order_id=order_id)
-                order.status = 'Confirmée'
-                order.payment_token = payment_intent['id']
-                order.save()
-            except Order.DoesNotExist as e:
-                print('Commande introuvable')
-                return HttpResponse(status=400)
-        
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event.data.object
-        error_message = payment_intent['last_payment_error']['message']
-        print(f'Erreur lors du paiement: {error_message}')
-        return HttpResponse(status=400)
-    
-    elif event['type'] == 'charge.refunded':
-        charge = event.data.object
-        metadata = charge.get('metadata', {})
-        order_id = metadata['order_id']
-        if order_id:
-            try:
-                order = Order.objects.get(order_id=order_id)
-                order.status = 'Annulée'
-                order.save()
-            except Order.DoesNotExist as e:
-                print('Commande introuvable')
-                return HttpResponse(status=400)
-
-    else:
-        print(f"event non pris en compte {event['type']}")
-    print('Transaction réussie ! :)')
-    return HttpResponse(status=200)
\ No newline at end of file
+    store_event(event['id'], event['type'], json.loads(payload))
+    return HttpResponse(status=200)
@@ -0,0 +1,66 @@
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = Path(__file__).resolve().parent / 'font' / 'open_sans.ttf'
+
+WATERMARK_TEXT = "@nathalielncle"
+WATERMARK_SIZE = 50
+WATERMARK_ANGLE = -30
+WATERMARK_COLOR = (51, 51, 51)
+TILE_SPACING = 50
+
+
+@lru_cache(maxsize=None)
+def get_font(size):
+    """
+    Load the FreeType font once per size
+    """
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+@lru_cache(maxsize=32)
+def get_tile(text, size, angle):
+    """
+    Draw the text once and rotate it, cached per (text, size, angle)
+    """
+    font = get_font(size)
+    text_bbox = font.getbbox(text)
+    tile_size = (text_bbox[2] + 20, text_bbox[3] + 20)
+    tile = Image.new('RGBA', tile_size, (0, 0, 0, 0))
+
+    draw = ImageDraw.Draw(tile)
+    draw.text((10, 10), text, font=font, fill=WATERMARK_COLOR)
+    return tile.rotate(angle, expand=True)
+
+
+@lru_cache(maxsize=16)
+def get_layer(canvas_size, text=WATERMARK_TEXT, size=WATERMARK_SIZE, angle=WATERMARK_ANGLE):
+    """
+    Full canvas watermark layer, built once per target resolution.
+    resize_image always produces 600x800, so nearly every product hits the cache.
+    The returned image is shared: never modify it in place.
+    """
+    tile = get_tile(text, size, angle)
+    width, height = canvas_size
+
+    layer = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
+    for x in range(0, width, tile.width + TILE_SPACING):
+        for y in range(0, height, tile.height + TILE_SPACING):
+            layer.paste(tile, (x, y), tile)
+    return layer
+
+
+def apply_watermark(img):
+    """
+    Return a new RGB image with the cached watermark layer composited on top
+    """
+    img = img.convert('RGBA')
+    return Image.alpha_composite(img, get_layer(img.size)).convert('RGB')
+
+
+def clear_caches():
+    get_font.cache_clear()
+    get_tile.cache_clear()
+    get_layer.cache_clear()
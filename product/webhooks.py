@@ -0,0 +1,120 @@
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import backoff_delay, claim_next
+from .models import Order, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# Attempts before an event is marked as failed (replay_webhooks --failed queues it again)
+MAX_ATTEMPTS = getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 5)
+
+HANDLERS = {}
+
+
+def handles(event_type):
+    def decorator(handler):
+        HANDLERS[event_type] = handler
+        return handler
+    return decorator
+
+
+def store_event(event_id, event_type, payload):
+    """
+    Fast path of the webhook: one INSERT, ignored if Stripe already sent this event
+    """
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=event_id, type=event_type, payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def event_order(event):
+    """
+    The order named in the event metadata, locked until the end of the transaction
+    """
+    order_id = (event.payload['data']['object'].get('metadata') or {}).get('order_id')
+    if not order_id:
+        return None
+    return Order.objects.select_for_update().get(order_id=order_id)
+
+
+@handles('payment_intent.succeeded')
+def confirm_order(event):
+    intent = event.payload['data']['object']
+    with transaction.atomic():
+        order = event_order(event)
+        # Already applied, or refunded in the meantime
+        if order is None or order.status != Order.StatusChoices.PENDING:
+            return
+        order.status = Order.StatusChoices.CONFIRMED
+        order.payment_token = intent['id']
+        order.save(update_fields=['status', 'payment_token'])
+
+
+@handles('charge.refunded')
+def cancel_order(event):
+    with transaction.atomic():
+        order = event_order(event)
+        if order is None or order.status == Order.StatusChoices.CANCELLED:
+            return
+        order.status = Order.StatusChoices.CANCELLED
+        order.save(update_fields=['status'])
+
+
+@handles('payment_intent.payment_failed')
+def log_payment_failure(event):
+    error = event.payload['data']['object'].get('last_payment_error') or {}
+    logger.warning("Erreur lors du paiement: %s", error.get('message'))
+
+
+def claim_next_event(now=None):
+    pk = claim_next(WebhookEvent, now)
+    if pk is None:
+        return None
+    return WebhookEvent.objects.get(pk=pk)
+
+
+def run_event(event):
+    """
+    Apply the event, retrying later on failure. Return True if it was applied.
+    Events without a handler are simply marked as done.
+    """
+    handler = HANDLERS.get(event.type)
+    try:
+        if handler is not None:
+            handler(event)
+    except Exception:
+        event.last_error = traceback.format_exc()
+        event.locked_at = None
+        if event.attempts < MAX_ATTEMPTS:
+            event.status = WebhookEvent.StatusChoices.QUEUED
+            event.run_after = timezone.now() + backoff_delay(event.attempts)
+        else:
+            event.status = WebhookEvent.StatusChoices.FAILED
+        event.save(update_fields=['status', 'run_after', 'locked_at', 'last_error'])
+        return False
+
+    event.status = WebhookEvent.StatusChoices.DONE
+    event.locked_at = None
+    event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'locked_at', 'processed_at'])
+    return True
+
+
+def run_pending_events(limit=None):
+    """
+    Apply every runnable event (or at most `limit`), return the number processed
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        event = claim_next_event()
+        if event is None:
+            break
+        run_event(event)
+        processed += 1
+    return processed
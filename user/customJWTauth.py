@@ -1,11 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import TokenUser
+
+# Build request.user from the token claims instead of loading it on every request
+JWT_STATELESS_USER = getattr(settings, 'JWT_STATELESS_USER', True)
+# Seconds before a deactivated (or demoted) user is noticed by the stateless path
+USER_STATUS_TIMEOUT = getattr(settings, 'JWT_USER_STATUS_TIMEOUT', 60)
+
+USER_CLAIMS = ('email', 'is_staff')
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Carries the claims needed to build the user without a query,
+    the access tokens made from it copy them
+    """
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class UserAccessToken(AccessToken):
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+def status_key(user_id):
+    return f'user:status:{user_id}'
+
+
+def user_status(user_model, user_id):
+    """
+    (is_active, is_staff) of the user, None if it was deleted. Cached for
+    USER_STATUS_TIMEOUT seconds.
+    """
+    status = cache.get(status_key(user_id))
+    if status is None:
+        status = user_model.objects.filter(pk=user_id).values_list('is_active', 'is_staff').first() or ()
+        cache.set(status_key(user_id), status, USER_STATUS_TIMEOUT)
+    return tuple(status) or None
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
         """
-        Set the Token in the headers from the cookies
+        Read the token from the cookies, then from the Authorization header
+        """
+        raw_token = request.COOKIES.get('access_token')
+        if not raw_token:
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        """
+        A TokenUser built from the claims: only id, email, is_staff and
+        is_active are set, the other fields are loaded by Django on first
+        access. Tokens issued without these claims go through the database.
         """
-        access_token = request.COOKIES.get('access_token')
-        if access_token:
-            request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
-        return super().authenticate(request)
\ No newline at end of file
+        if not JWT_STATELESS_USER or any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        status = user_status(self.user_model, user_id)
+        if status is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        is_active, is_staff = status
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        user = TokenUser.from_db(
+            router.db_for_read(TokenUser),
+            [api_settings.USER_ID_FIELD, 'email', 'is_staff', 'is_active'],
+            # A signed claim cannot give more rights than the database
+            [user_id, validated_token['email'], validated_token['is_staff'] and is_staff, True],
+        )
+        user._claims_unverified = True
+        return user
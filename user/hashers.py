@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+class ConfigurableArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 with the cost taken from the settings (see the bench_password_hasher
+    command). Same algorithm name, so existing hashes still verify, and Django
+    rehashes a password on login when its parameters differ from the settings.
+    """
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
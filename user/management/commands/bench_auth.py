@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from product.benchmarks import rolled_back
+from product.models import Category, Order, OrderItem, Product
+from user import customJWTauth
+from user.customJWTauth import UserRefreshToken
+from user.models import MyUser
+
+
+class Command(BaseCommand):
+    help = "Authenticated requests per second on /api/v1/orders/: user loaded from the database vs built from the token (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=5)
+        parser.add_argument(
+            '--db-latency', type=float, default=0.0005,
+            help="Seconds added to each query, as a round trip to a database server would",
+        )
+
+    def handle(self, *args, **options):
+        def round_trip(execute, sql, params, many, context):
+            time.sleep(options['db_latency'])
+            return execute(sql, params, many, context)
+
+        with rolled_back('auth'), connection.execute_wrapper(round_trip):
+            self.run(options)
+
+    def run(self, options):
+        user = MyUser.objects.create_user('Bench', 'Mark', 'bench-auth@example.com', 'Password123!')
+        category = Category.objects.create(name='Bench', slug='bench-auth')
+        product = Product.objects.create(category=category, name='Dessin', slug='dessin', price=25)
+        for _ in range(options['orders']):
+            order = Order.objects.create(user=user, status=Order.StatusChoices.CONFIRMED)
+            OrderItem.objects.create(order=order, product=product, quantity=2)
+            order.update_totals()
+
+        client = APIClient(SERVER_NAME='localhost')
+        client.cookies['access_token'] = str(UserRefreshToken.for_user(user).access_token)
+        stateless = customJWTauth.JWT_STATELESS_USER
+        try:
+            for name, mode in (('database', False), ('stateless', True)):
+                customJWTauth.JWT_STATELESS_USER = mode
+                # The private cache of rolled_back(), not the live one
+                cache.clear()
+                client.get('/api/v1/orders/')
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = client.get('/api/v1/orders/')
+                    elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                self.stdout.write(
+                    f"{name:>9}: {options['requests'] / elapsed:7.0f} requests/s, "
+                    f"{elapsed / options['requests'] * 1000:.2f} ms/request, "
+                    f"{len(queries) / options['requests']:.1f} queries/request"
+                )
+        finally:
+            customJWTauth.JWT_STATELESS_USER = stateless
@@ -0,0 +1,61 @@
+from statistics import median
+import time
+
+import argon2
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+# KiB: 19 MiB, 46 MiB, 64 MiB, Django's default (100 MiB)
+MEMORY_COSTS = (19456, 47104, 65536, 102400)
+PASSWORD = 'Password123!'
+
+
+class Command(BaseCommand):
+    help = "Argon2 hashing time on this host for several costs, and the strongest one under a target latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help="Acceptable hashing time of one login")
+        parser.add_argument('--memory-costs', type=int, nargs='+', default=MEMORY_COSTS, help="KiB")
+        parser.add_argument('--parallelism', type=int, default=None, help="Default: the current setting")
+        parser.add_argument('--max-time-cost', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def measure(self, time_cost, memory_cost, parallelism, repeat):
+        hasher = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hasher.hash(PASSWORD)
+            timings.append((time.perf_counter() - start) * 1000)
+        return median(timings)
+
+    def handle(self, *args, **options):
+        current = get_hasher('argon2')
+        parallelism = options['parallelism'] or current.parallelism
+        target = options['target_ms']
+        self.stdout.write(
+            f"Current: time_cost={current.time_cost} memory_cost={current.memory_cost} "
+            f"parallelism={current.parallelism}: "
+            f"{self.measure(current.time_cost, current.memory_cost, current.parallelism, options['repeat']):.0f} ms"
+        )
+
+        candidates = []
+        for memory_cost in options['memory_costs']:
+            for time_cost in range(1, options['max_time_cost'] + 1):
+                elapsed = self.measure(time_cost, memory_cost, parallelism, options['repeat'])
+                self.stdout.write(f"time_cost={time_cost:<3} memory_cost={memory_cost:<7} {elapsed:7.0f} ms")
+                if elapsed > target:
+                    break
+                candidates.append((memory_cost * time_cost, time_cost, memory_cost, elapsed))
+
+        if not candidates:
+            self.stdout.write(self.style.WARNING(f"No parameters under {target:.0f} ms, lower the memory cost"))
+            return
+
+        # The most work (memory passes) that fits in the target
+        _, time_cost, memory_cost, elapsed = max(candidates)
+        self.stdout.write(self.style.SUCCESS(f"Recommended for {target:.0f} ms ({elapsed:.0f} ms measured):"))
+        self.stdout.write(f"ARGON2_TIME_COST={time_cost}")
+        self.stdout.write(f"ARGON2_MEMORY_COST={memory_cost}")
+        self.stdout.write(f"ARGON2_PARALLELISM={parallelism}")
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from product.benchmarks import rolled_back
+from user import tokens
+from user.customJWTauth import UserAccessToken, UserRefreshToken
+from user.models import MyUser
+
+
+class Command(BaseCommand):
+    help = "Refresh requests per second on /api/v1/jwt/refresh/, and cost of the restore_cookies token (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with rolled_back('token-refresh'):
+            self.run(options)
+
+    def timed(self, function, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        return time.perf_counter() - start
+
+    def run(self, options):
+        count = options['requests']
+        user = MyUser.objects.create_user('Bench', 'Mark', 'bench-refresh@example.com', 'Password123!')
+        client = APIClient(SERVER_NAME='localhost')
+        rotate = tokens.ROTATE_REFRESH_TOKENS
+
+        try:
+            for name, mode in (('refresh', False), ('rotating', True)):
+                tokens.ROTATE_REFRESH_TOKENS = mode
+                client.cookies['refresh_token'] = str(UserRefreshToken.for_user(user))
+
+                def refresh():
+                    response = client.post('/api/v1/jwt/refresh/')
+                    assert response.status_code == 200, response.content
+
+                elapsed = self.timed(refresh, count)
+                self.stdout.write(f"{name:>9}: {count / elapsed:7.0f} requests/s, {elapsed / count * 1000:.2f} ms/request")
+        finally:
+            tokens.ROTATE_REFRESH_TOKENS = rotate
+
+        # restore_cookies only needs the access token
+        for name, mint in (
+            ('refresh + access', lambda: str(UserRefreshToken.for_user(user).access_token)),
+            ('access only', lambda: str(UserAccessToken.for_user(user))),
+        ):
+            elapsed = self.timed(mint, count)
+            self.stdout.write(f"{name:>16}: {elapsed / count * 1e6:6.1f} µs/token")
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_myuser_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('user.myuser',),
+        ),
+    ]
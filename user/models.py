@@ -27,4 +27,38 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
     
     @property
     def get_full_name(self):
-        return f"{self.first_name} {self.last_name}"
\ No newline at end of file
+        return f"{self.first_name} {self.last_name}"
+
+class TokenUser(MyUser):
+    """
+    Built by CookieJWTAuthentication from the access token claims, which may
+    be older than the row: the claimed fields are loaded from the database
+    before anything is written, so a save never writes the claims back.
+    """
+    CLAIMED_FIELDS = ('email', 'is_staff', 'is_active')
+
+    class Meta:
+        proxy = True
+
+    def load_claimed_fields(self):
+        if self.__dict__.pop('_claims_unverified', False):
+            self.refresh_from_db(fields=self.CLAIMED_FIELDS)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        """
+        Loading a deferred field is not a write: the claims stay unverified
+        unless they were refreshed too
+        """
+        unverified = self.__dict__.pop('_claims_unverified', False)
+        super().refresh_from_db(using, fields, **kwargs)
+        if unverified and fields is not None and not set(self.CLAIMED_FIELDS) <= set(fields):
+            self._claims_unverified = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_claims_unverified') and name in {field.attname for field in self._meta.concrete_fields}:
+            self.load_claimed_fields()
+        super().__setattr__(name, value)
+
+    def save(self, *args, **kwargs):
+        self.load_claimed_fields()
+        super().save(*args, **kwargs)
@@ -2,6 +2,8 @@ from django.core.exceptions import ValidationError
 from .custom_validator import MyPasswordValidator
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .customJWTauth import UserRefreshToken
 from .models import MyUser
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -41,4 +43,7 @@ class CreateUserSerializer(UserCreateSerializer):
         user.set_password(password)
         user.save()
 
-        return user
\ No newline at end of file
+        return user
+
+class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = UserRefreshToken
@@ -1,10 +1,42 @@
-from django.test import TestCase
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.contrib.auth import get_user_model
 
+from .customJWTauth import CookieJWTAuthentication, UserAccessToken, UserRefreshToken
+from .hashers import ConfigurableArgon2PasswordHasher
+from .throttling import THROTTLE_CACHE, LocalBucketStore, get_store
+from . import tokens
+
+# silk records its own queries in dev, keep it out of query counts
+without_silk = modify_settings(MIDDLEWARE={'remove': ['silk.middleware.SilkyMiddleware']})
+
+
+def run_queries(queries):
+    """Queries of a CaptureQueriesContext, without the EXPLAIN added by silk after a silked request"""
+    return [query['sql'] for query in queries if not query['sql'].startswith('EXPLAIN')]
+
+
+def clear_throttles():
+    """Every test client comes from 127.0.0.1: start with full buckets"""
+    caches[THROTTLE_CACHE].clear()
+    get_store().reset()
+
+
 class CreateUserSerializerTests(TestCase):
     def setUp(self):
+        clear_throttles()
         self.client = APIClient()
         self.url = '/api/v1/auth/users/'
 
@@ -81,3 +113,338 @@ class CreateUserSerializerTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         user = get_user_model().objects.get(email=data['email'])
         self.assertTrue(user.check_password(data['password']))
+
+
+@without_silk
+class StatelessJWTTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!', is_staff=True)
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/v1/jwt/create/', {'email': 'jean@example.com', 'password': 'Password123!'}, format='json')
+        self.assertTrue(response.data['success'])
+
+    def user_queries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [sql for sql in run_queries(queries) if 'FROM "user_myuser"' in sql]
+
+    def test_authenticated_requests_skip_the_user_query(self):
+        self.login()
+        # First request: the cached status check
+        self.assertEqual(len(self.user_queries(lambda: self.client.get('/api/v1/orders/'))), 1)
+        self.assertEqual(self.user_queries(lambda: self.client.get('/api/v1/orders/')), [])
+
+    def test_bearer_header_is_still_accepted(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.assertEqual(self.client.get('/api/v1/orders/').status_code, status.HTTP_200_OK)
+
+    def test_user_fields_are_loaded_on_access(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        user = CookieJWTAuthentication().get_user(token)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual((user.pk, user.email, user.is_staff, user.is_active), (self.user.pk, 'jean@example.com', True, True))
+        self.assertEqual(run_queries(queries), [])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(user.first_name, 'Jean')
+        self.assertEqual(len(run_queries(queries)), 1)
+
+    def test_inactive_user_is_rejected(self):
+        self.login()
+        self.user.is_active = False
+        self.user.save()
+        cache.clear()
+
+        self.assertEqual(self.client.get('/api/v1/orders/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_claim_cannot_keep_revoked_staff_rights(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        get_user_model().objects.filter(pk=self.user.pk).update(is_staff=False)
+
+        self.assertFalse(CookieJWTAuthentication().get_user(token).is_staff)
+
+    def stale_token_client(self):
+        """
+        A client holding a token issued before the email changed and staff rights were revoked
+        """
+        self.client.cookies['access_token'] = str(UserRefreshToken.for_user(self.user).access_token)
+        get_user_model().objects.filter(pk=self.user.pk).update(email='jean.dupont@example.com', is_staff=False)
+        cache.clear()
+        return self.client
+
+    def assertClaimsNotWritten(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        self.assertEqual((user.email, user.is_staff), ('jean.dupont@example.com', False))
+        return user
+
+    def test_password_change_keeps_the_database_values(self):
+        response = self.stale_token_client().post(
+            '/api/v1/auth/users/set_password/', {'current_password': 'Password123!', 'new_password': 'Nouveau123!'}, format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(self.assertClaimsNotWritten().check_password('Nouveau123!'))
+
+    def test_profile_update_keeps_the_database_values(self):
+        client = self.stale_token_client()
+        response = client.patch('/api/v1/auth/users/me/', {'first_name': 'Jeannot'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['email'], 'jean.dupont@example.com')
+        self.assertEqual(self.assertClaimsNotWritten().first_name, 'Jeannot')
+        self.assertEqual(client.get('/api/v1/auth/users/me/').json()['email'], 'jean.dupont@example.com')
+
+    def test_tokens_without_claims_load_the_user(self):
+        token = RefreshToken.for_user(self.user).access_token
+
+        with CaptureQueriesContext(connection) as queries:
+            user = CookieJWTAuthentication().get_user(token)
+        self.assertEqual(len(run_queries(queries)), 1)
+        self.assertEqual(user.first_name, 'Jean')
+
+
+CHEAP_ARGON2 = {'ARGON2_TIME_COST': 1, 'ARGON2_MEMORY_COST': 8192, 'ARGON2_PARALLELISM': 1}
+
+
+def argon2_params(encoded):
+    decoded = get_hasher('argon2').decode(encoded)
+    return decoded['time_cost'], decoded['memory_cost'], decoded['parallelism']
+
+
+@without_silk
+class PasswordHasherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+
+    def login(self):
+        return self.client.post('/api/v1/jwt/create/', {'email': 'jean@example.com', 'password': 'Password123!'})
+
+    @override_settings(**CHEAP_ARGON2)
+    def test_cost_comes_from_the_settings(self):
+        self.assertEqual(argon2_params(make_password('Password123!')), (1, 8192, 1))
+
+    def test_login_rehashes_when_the_cost_changes(self):
+        self.assertEqual(argon2_params(self.user.password), (2, 102400, 8))
+
+        with override_settings(**CHEAP_ARGON2):
+            self.assertTrue(self.login().json()['success'])
+            self.user.refresh_from_db()
+            self.assertEqual(argon2_params(self.user.password), (1, 8192, 1))
+            rehashed = self.user.password
+
+            self.login()
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.password, rehashed)
+
+    def test_wsgi_login_runs_in_the_request_thread(self):
+        verify = ConfigurableArgon2PasswordHasher.verify
+        threads = []
+
+        def record(hasher, password, encoded):
+            threads.append(threading.current_thread())
+            return verify(hasher, password, encoded)
+
+        with mock.patch.object(ConfigurableArgon2PasswordHasher, 'verify', autospec=True, side_effect=record):
+            self.assertTrue(self.login().json()['success'])
+        self.assertEqual(threads, [threading.current_thread()])
+
+
+@without_silk
+class AsgiLoginTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        get_user_model().objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+
+    async def test_login_is_offloaded_from_the_shared_sync_thread(self):
+        verify = ConfigurableArgon2PasswordHasher.verify
+        threads = []
+
+        def record(hasher, password, encoded):
+            threads.append(threading.current_thread())
+            return verify(hasher, password, encoded)
+
+        with mock.patch.object(ConfigurableArgon2PasswordHasher, 'verify', autospec=True, side_effect=record):
+            response = await AsyncClient().post(
+                '/api/v1/jwt/create/', {'email': 'jean@example.com', 'password': 'Password123!'},
+                content_type='application/json',
+            )
+
+        self.assertTrue(response.json()['success'])
+        self.assertIn('access_token', response.cookies)
+        # Thread sensitive code runs in the main thread here
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+
+@without_silk
+class ThrottleTests(TestCase):
+    def setUp(self):
+        clear_throttles()
+        rates = mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {
+            'login_ip': '10/min', 'login_email': '1000/min', 'register_ip': '2/hour',
+        })
+        rates.start()
+        self.addCleanup(rates.stop)
+        self.user = get_user_model().objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+
+    def login(self, email='jean@example.com', password='Wrong123!', ip='10.0.0.1', **headers):
+        return self.client.post('/api/v1/jwt/create/', {'email': email, 'password': password}, REMOTE_ADDR=ip, **headers)
+
+    def test_rotating_forwarded_for_is_still_limited(self):
+        throttled = [self.login(HTTP_X_FORWARDED_FOR=f'1.2.3.{index}').status_code == 429 for index in range(12)]
+        self.assertEqual(throttled, [False] * 10 + [True] * 2)
+
+    def test_behind_a_proxy_only_the_appended_ip_counts(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            throttled = [
+                self.login(ip='10.0.0.254', HTTP_X_FORWARDED_FOR=f'1.2.3.{index}, 10.0.0.7').status_code == 429
+                for index in range(12)
+            ]
+            self.assertEqual(throttled, [False] * 10 + [True] * 2)
+            self.assertNotEqual(self.login(ip='10.0.0.254', HTTP_X_FORWARDED_FOR='10.0.0.8').status_code, 429)
+
+    def test_burst_is_rejected_before_hashing(self):
+        verify = ConfigurableArgon2PasswordHasher.verify
+        accepted, rejected = [], []
+
+        with mock.patch.object(ConfigurableArgon2PasswordHasher, 'verify', autospec=True, side_effect=verify) as hasher:
+            for _ in range(60):
+                start = time.process_time()
+                response = self.login()
+                elapsed = time.process_time() - start
+                (rejected if response.status_code == 429 else accepted).append(elapsed)
+
+        self.assertEqual((len(accepted), len(rejected)), (10, 50))
+        self.assertEqual(hasher.call_count, 10)
+        # A rejected request costs a small fraction of one Argon2 verification
+        self.assertLess(sum(rejected) / len(rejected) * 20, sum(accepted) / len(accepted))
+
+    def test_email_is_limited_across_ips(self):
+        SimpleRateThrottle.THROTTLE_RATES.update({'login_ip': '1000/min', 'login_email': '3/min'})
+
+        throttled = [self.login(ip=f'10.0.0.{index}').status_code == 429 for index in range(5)]
+        self.assertEqual(throttled, [False, False, False, True, True])
+        # Another account is not affected
+        self.assertNotEqual(self.login(email='marie@example.com', ip='10.0.0.9').status_code, 429)
+
+    def test_registration_is_limited_per_ip(self):
+        data = {'first_name': 'John', 'last_name': 'Doe', 'password': 'Password123!', 're_password': 'Password123!'}
+        statuses = [
+            self.client.post('/api/v1/auth/users/', {**data, 'email': f'john{index}@example.com'}, REMOTE_ADDR='10.0.0.2').status_code
+            for index in range(3)
+        ]
+
+        self.assertEqual(statuses, [201, 201, 429])
+
+    def test_rejections_are_counted_for_staff(self):
+        for _ in range(12):
+            self.login()
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        self.assertEqual(api.get('/api/v1/throttle/stats/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        api.force_authenticate(self.user)
+        self.assertEqual(api.get('/api/v1/throttle/stats/').json(), {'login_ip': 2})
+
+    def test_local_store_refills_and_stays_bounded(self):
+        store = LocalBucketStore(max_buckets=2)
+
+        self.assertEqual([store.consume('a', 2, 60, 0)[0] for _ in range(3)], [True, True, False])
+        self.assertEqual(store.consume('a', 2, 60, 0), (False, 30))
+        # One token every 30 seconds
+        self.assertTrue(store.consume('a', 2, 60, 30)[0])
+
+        store.consume('b', 2, 60, 30)
+        store.consume('c', 2, 60, 30)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+
+@without_silk
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('Jean', 'Dupont', 'jean@example.com', 'Password123!')
+        self.refresh = UserRefreshToken.for_user(self.user)
+        self.client.cookies['refresh_token'] = str(self.refresh)
+
+    def refresh_cookies(self):
+        return self.client.post('/api/v1/jwt/refresh/')
+
+    def test_form_post_refreshes_the_access_cookie(self):
+        # An empty form body is an immutable QueryDict
+        response = self.refresh_cookies()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['refreshed'])
+        access = AccessToken(response.cookies['access_token'].value)
+        self.assertEqual((access['user_id'], access['email']), (self.user.pk, 'jean@example.com'))
+        self.assertNotIn('refresh_token', response.cookies)
+
+    def test_missing_or_invalid_token_is_unauthorized(self):
+        self.client.cookies['refresh_token'] = 'abc'
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_401_UNAUTHORIZED)
+
+        del self.client.cookies['refresh_token']
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_body_that_is_not_an_object_is_rejected(self):
+        for body in (['refresh'], 'refresh', 1):
+            response = self.client.post('/api/v1/jwt/refresh/', body, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        del self.client.cookies['refresh_token']
+        response = self.client.post('/api/v1/jwt/refresh/', {'refresh': ['a']}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_skips_the_user_query_once_its_status_is_cached(self):
+        self.refresh_cookies()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh_cookies().status_code, status.HTTP_200_OK)
+        self.assertEqual(run_queries(queries), [])
+
+    def test_deactivated_user_cannot_refresh(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @mock.patch.object(tokens, 'ROTATE_REFRESH_TOKENS', True)
+    def test_rotation_denies_the_used_token(self):
+        response = self.refresh_cookies()
+        rotated = response.cookies['refresh_token'].value
+        self.assertNotEqual(RefreshToken(rotated)['jti'], self.refresh['jti'])
+
+        # The client now holds the rotated token
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_200_OK)
+
+        self.client.cookies['refresh_token'] = str(self.refresh)
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_denies_the_refresh_token(self):
+        self.client.post('/api/v1/logout/')
+
+        self.client.cookies['refresh_token'] = str(self.refresh)
+        self.assertEqual(self.refresh_cookies().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_restore_cookies_only_mints_an_access_token(self):
+        self.client.cookies['access_token'] = str(UserAccessToken.for_user(self.user))
+        self.client.get('/api/v1/restaure_cookies/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/restaure_cookies/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(run_queries(queries), [])
+        access = AccessToken(response.cookies['access_token'].value)
+        self.assertEqual((access['user_id'], access['is_staff']), (self.user.pk, False))
+        self.assertNotIn('refresh_token', response.cookies)
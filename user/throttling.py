@@ -0,0 +1,181 @@
+from collections import Counter, OrderedDict
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+# 'cache': buckets shared by every worker through THROTTLE_CACHE, 'local': per process
+THROTTLE_STORE = getattr(settings, 'THROTTLE_STORE', 'cache')
+THROTTLE_CACHE = getattr(settings, 'THROTTLE_CACHE', 'default')
+# Buckets kept by the local store, the oldest ones are dropped beyond that
+LOCAL_MAX_BUCKETS = 10000
+
+
+def refill(bucket, capacity, duration, now):
+    """
+    Tokens left in the bucket at `now`: it starts full and regains
+    `capacity` tokens per `duration` seconds
+    """
+    if bucket is None:
+        return capacity
+    tokens, updated_at = bucket
+    return min(capacity, tokens + (now - updated_at) * capacity / duration)
+
+
+def take(bucket, capacity, duration, now):
+    """
+    (allowed, new bucket, seconds until the next token)
+    """
+    tokens = refill(bucket, capacity, duration, now)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) * duration / capacity
+
+
+class LocalBucketStore:
+    """
+    Buckets in the memory of the process: no round trip, but each worker
+    counts on its own
+    """
+
+    def __init__(self, max_buckets=LOCAL_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.buckets = OrderedDict()
+            self.rejected = Counter()
+
+    def consume(self, key, capacity, duration, now):
+        with self.lock:
+            allowed, self.buckets[key], wait = take(self.buckets.get(key), capacity, duration, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return allowed, wait
+
+    def count_rejected(self, scope):
+        with self.lock:
+            self.rejected[scope] += 1
+
+    def rejected_counts(self):
+        with self.lock:
+            return dict(self.rejected)
+
+
+class CacheBucketStore:
+    """
+    Buckets in a shared cache. Read then write: two concurrent requests can
+    both take the last token, which is fine to slow down a burst.
+    """
+
+    def __init__(self, alias=THROTTLE_CACHE):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def reset(self):
+        self.cache.delete_many([self.rejected_key(scope) for scope in self.scopes()])
+
+    def consume(self, key, capacity, duration, now):
+        allowed, bucket, wait = take(self.cache.get(key), capacity, duration, now)
+        # An untouched bucket is full again after `duration`
+        self.cache.set(key, bucket, duration)
+        return allowed, wait
+
+    def rejected_key(self, scope):
+        return f'throttle:rejected:{scope}'
+
+    def scopes(self):
+        return list(SimpleRateThrottle.THROTTLE_RATES)
+
+    def count_rejected(self, scope):
+        key = self.rejected_key(scope)
+        if not self.cache.add(key, 1, None):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # Evicted between add() and incr()
+                self.cache.set(key, 1, None)
+
+    def rejected_counts(self):
+        counts = self.cache.get_many([self.rejected_key(scope) for scope in self.scopes()])
+        return {scope: counts[self.rejected_key(scope)] for scope in self.scopes() if self.rejected_key(scope) in counts}
+
+
+_stores = {'cache': CacheBucketStore, 'local': LocalBucketStore}
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = _stores[THROTTLE_STORE]()
+    return _store
+
+
+def rejected_counts():
+    return get_store().rejected_counts()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket on the DRF rate of the scope ('20/min': bursts of 20, then
+    one request every 3 seconds). Throttles run in APIView.initial(), so a
+    rejected login never reaches the password hasher.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        store = get_store()
+        allowed, self.wait_time = store.consume(key, self.num_requests, self.duration, self.timer())
+        if not allowed:
+            store.count_rejected(self.scope)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class IPThrottle(TokenBucketThrottle):
+    """
+    Per client IP, as seen through REST_FRAMEWORK['NUM_PROXIES'] proxies
+    """
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class EmailThrottle(TokenBucketThrottle):
+    """
+    Per targeted account, whatever the number of IPs the attempts come from
+    """
+    def get_cache_key(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        ident = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class LoginEmailThrottle(EmailThrottle):
+    scope = 'login_email'
+
+
+class RegisterIPThrottle(IPThrottle):
+    scope = 'register_ip'
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .customJWTauth import UserRefreshToken, user_status
+
+# Give a new refresh cookie at each refresh, the used one can no longer be replayed
+ROTATE_REFRESH_TOKENS = getattr(settings, 'JWT_ROTATE_REFRESH_TOKENS', False)
+DENYLIST_CACHE = getattr(settings, 'JWT_DENYLIST_CACHE', 'default')
+
+ACCESS_COOKIE_MAX_AGE = 600
+REFRESH_COOKIE_MAX_AGE = 86400
+
+
+def denylist_key(jti):
+    return f'jwt:denied:{jti}'
+
+
+def deny(token):
+    """
+    Refuse the token until it expires. Return False if it was already refused.
+    Kept in a cache instead of the blacklist tables: one write, no outstanding tokens.
+    """
+    remaining = token['exp'] - int(token.current_time.timestamp())
+    if remaining <= 0:
+        return True
+    return caches[DENYLIST_CACHE].add(denylist_key(token[api_settings.JTI_CLAIM]), 1, remaining)
+
+
+def is_denied(token):
+    return caches[DENYLIST_CACHE].get(denylist_key(token[api_settings.JTI_CLAIM])) is not None
+
+
+def refresh_tokens(raw_refresh, rotate=None):
+    """
+    (access token, new refresh token or None) from a refresh token, verified
+    once. Raise TokenError if it is invalid, expired, already used or if its
+    user was deactivated (status cached, see customJWTauth.user_status).
+    """
+    rotate = ROTATE_REFRESH_TOKENS if rotate is None else rotate
+    refresh = UserRefreshToken(raw_refresh)
+    if is_denied(refresh):
+        raise TokenError(_("Token is blacklisted"))
+
+    status = user_status(get_user_model(), refresh[api_settings.USER_ID_CLAIM])
+    if status is None or not status[0]:
+        raise TokenError(_("User is inactive"))
+
+    access = refresh.access_token
+    if not rotate:
+        return access, None
+
+    # add() in the shared cache: of two concurrent refreshes with the same token, one fails
+    if not deny(refresh):
+        raise TokenError(_("Token is blacklisted"))
+    refresh.set_jti()
+    refresh.set_exp()
+    refresh.set_iat()
+    return access, refresh
+
+
+def set_access_cookie(response, token):
+    response.set_cookie(
+        key="access_token",
+        value=str(token),
+        httponly=True,
+        secure=True,
+        samesite='None',
+        path='/',
+        max_age=ACCESS_COOKIE_MAX_AGE
+    )
+
+
+def set_refresh_cookie(response, token):
+    response.set_cookie(
+        key="refresh_token",
+        value=str(token),
+        httponly=True,
+        secure=True,
+        samesite='None',
+        path='/',
+        max_age=REFRESH_COOKIE_MAX_AGE
+    )
@@ -1,10 +1,17 @@
 from django.urls import path, include
-from .views import logout, MyTokenObtainPairView, MyTokenRefreshView, restore_cookies
+from rest_framework.routers import DefaultRouter
+from .views import logout, MyTokenObtainPairView, MyTokenRefreshView, offload_to_thread, restore_cookies, throttle_stats, ThrottledUserViewSet
+
+# Takes over the users routes of djoser.urls
+router = DefaultRouter()
+router.register('users', ThrottledUserViewSet)
 
 urlpatterns = [
+    path('auth/', include(router.urls)),
     path('auth/', include('djoser.urls')),
+    path('throttle/stats/', throttle_stats),
     path('restaure_cookies/', restore_cookies),
-    path('jwt/create/', MyTokenObtainPairView.as_view(), name='jwt-create'),
+    path('jwt/create/', offload_to_thread(MyTokenObtainPairView.as_view()), name='jwt-create'),
     path('jwt/refresh/', MyTokenRefreshView.as_view(), name='jwt-refresh'),
     path('logout/', logout),
 ]
\ No newline at end of file
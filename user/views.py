@@ -1,13 +1,45 @@
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from .customJWTauth import UserAccessToken, UserRefreshToken
+from .models import TokenUser
+from .tokens import deny, refresh_tokens, set_access_cookie, set_refresh_cookie
 from django.middleware.csrf import get_token
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from asgiref.sync import sync_to_async
+import functools
+from djoser.views import UserViewSet
+from .throttling import LoginEmailThrottle, LoginIPThrottle, RegisterIPThrottle, rejected_counts
+
+def offload_to_thread(view):
+    """
+    Under ASGI, Django runs every sync view in one shared thread, so a login
+    (CPU-bound password hashing) would hold up all the other sync requests.
+    Run the view in a worker thread of its own instead, closing the database
+    connection it opened there. Under WSGI the view runs as usual.
+    """
+    def run_and_close(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            connections.close_all()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if isinstance(request, ASGIRequest):
+            return await sync_to_async(run_and_close, thread_sensitive=False)(request, *args, **kwargs)
+        return await sync_to_async(view)(request, *args, **kwargs)
+    return wrapper
 
 class MyTokenObtainPairView(TokenObtainPairView):
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
+
     def post(self, request, *args, **kwargs):
         try:
             response = super().post(request, *args, **kwargs)
@@ -17,26 +49,8 @@ class MyTokenObtainPairView(TokenObtainPairView):
             refresh_token = tokens['refresh']
 
             res = Response({'success': True})
-
-            res.set_cookie(
-                key="access_token",
-                value=access_token,
-                httponly=True,
-                secure=True,
-                samesite='None',
-                path='/',
-                max_age=600
-            )
-
-            res.set_cookie(
-                key="refresh_token",
-                value=refresh_token,
-                httponly=True,
-                secure=True,
-                samesite='None',
-                path='/',
-                max_age=86400
-            )
+            set_access_cookie(res, access_token)
+            set_refresh_cookie(res, refresh_token)
 
             csrf_token = get_token(request)
             res.data['X-CSRFToken'] = csrf_token
@@ -51,38 +65,31 @@ class MyTokenObtainPairView(TokenObtainPairView):
         
 class MyTokenRefreshView(TokenRefreshView):
     def post(self, request, *args, **kwargs):
-        try:
-            refresh_token = request.COOKIES.get('refresh_token')
-
-            request.data['refresh'] = refresh_token
-
-            response = super().post(request, *args, **kwargs)
-
-            tokens = response.data
-            access_token = tokens['access']
-
-            res = Response({'refreshed': True})
+        """
+        New access cookie from the refresh cookie, and a new refresh
+        cookie when rotation is enabled (JWT_ROTATE_REFRESH_TOKENS)
+        """
+        # A JSON body can be a list or a scalar, only an object can carry the token
+        if not isinstance(request.data, dict):
+            return Response({'refreshed': False, 'error': 'Invalid body'}, status=400)
+        refresh_token = request.COOKIES.get('refresh_token') or request.data.get('refresh')
+        if not refresh_token or not isinstance(refresh_token, str):
+            return Response({'refreshed': False, 'error': 'Token refresh failed'}, status=401)
 
-            res.set_cookie(
-                key="access_token",
-                value=access_token,
-                httponly=True,
-                secure=True,
-                samesite='None',
-                path='/',
-                max_age=600
-            )
+        try:
+            access_token, rotated = refresh_tokens(refresh_token)
+        except TokenError as e:
+            return Response({'refreshed': False, 'error': str(e)}, status=401)
 
-            csrf_token = get_token(request)
-            res.data['X-CSRFToken'] = csrf_token
+        res = Response({'refreshed': True})
+        set_access_cookie(res, access_token)
+        if rotated is not None:
+            set_refresh_cookie(res, rotated)
 
-            return res
-        
-        except KeyError:
-            return Response({'refreshed': False, 'error': 'Token refresh failed'}, status=401)
+        csrf_token = get_token(request)
+        res.data['X-CSRFToken'] = csrf_token
 
-        except Exception as e:
-            return Response({'refreshed': False, 'error': str(e)}, status=500)
+        return res
 
 @api_view(['POST'])
 def logout(request):
@@ -90,6 +97,12 @@ def logout(request):
     The front need to send the X-CSRFToken in the headers to logout
     """
     try:
+        refresh_token = request.COOKIES.get('refresh_token')
+        if refresh_token:
+            try:
+                deny(UserRefreshToken(refresh_token))
+            except TokenError:
+                pass
         res = Response({'success': True})
         res.delete_cookie('access_token', path='/', samesite='None')
         res.delete_cookie('refresh_token', path='/', samesite='None')
@@ -103,19 +116,33 @@ def restore_cookies(request):
     Restore the cookies, so the user can stay Logged in after Stripe redirect
     """
     if request.user.is_authenticated:
-        refresh = RefreshToken.for_user(request.user)
         res = Response({'cookies_restaured': True})
-
-        res.set_cookie(
-            key="access_token",
-            value=refresh.access_token,
-            httponly=True,
-            secure=True,
-            samesite='None',
-            path='/',
-            max_age=600
-        )
+        set_access_cookie(res, UserAccessToken.for_user(request.user))
 
         return res
     
-    return Response({'cookies_restaures': False, 'error': 'Not authenticated'}, status=401)
\ No newline at end of file
+    return Response({'cookies_restaures': False, 'error': 'Not authenticated'}, status=401)
+
+class ThrottledUserViewSet(UserViewSet):
+    """Djoser users endpoints, registration limited per IP"""
+    def get_throttles(self):
+        if self.action == 'create':
+            return [RegisterIPThrottle()]
+        return super().get_throttles()
+
+    def get_instance(self):
+        """
+        `me` is request.user: show the database values, not the token claims
+        """
+        user = super().get_instance()
+        if isinstance(user, TokenUser):
+            user.load_claimed_fields()
+        return user
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def throttle_stats(request):
+    """
+    Number of requests rejected by each throttle scope
+    """
+    return Response(rejected_counts())